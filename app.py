@@ -1,7 +1,9 @@
-import dataclasses, itertools
-from quart import Quart, render_template, request, Response, redirect, send_from_directory, url_for
-import re, yaml, json
+import asyncio, itertools, json, traceback
+from quart import Quart, render_template, request, Response, redirect, send_from_directory, url_for, websocket
+import re
 import findyoutubevideo
+from findyoutubevideo import serialization
+from findyoutubevideo.config import config
 
 class EscapingQuart(Quart):
     def select_jinja_autoescape(self, filename: str) -> bool:
@@ -9,13 +11,16 @@ class EscapingQuart(Quart):
 
 app = EscapingQuart(__name__)
 
-with open('config.yml', 'r') as file:
-    config_yml = yaml.safe_load(file)
-
 @app.before_serving
 async def _make_session():
     global FYT_SESSION
     FYT_SESSION = await findyoutubevideo.FytSession.new(True)
+    if (config.get("connections") or {}).get("prewarm"):
+        await FYT_SESSION.prewarm()
+
+@app.after_serving
+async def _close_session():
+    await FYT_SESSION.close()
 
 @app.route("/robots.txt")
 async def robots():
@@ -26,22 +31,206 @@ async def youtubev2(id):
     """
     Provides backwards compatibility for the old endpoint.
     """
-    return (await FYT_SESSION.generate(id)).coerce_to_api_version(2).json(), {"Content-Type": "application/json"}
+    return serialization.encode_response(await FYT_SESSION.generate(id), 2), {"Content-Type": "application/json"}
 
-async def wrapperYT(id, includeRaw):
+async def wrapperYT(id, includeRaw, staleWhileRevalidate=False, deadline=None, firstHit=False, include=None, exclude=None):
     """
     Wrapper for generate
     """
     try:
-        return await FYT_SESSION.generate(id, includeRaw)
+        return await FYT_SESSION.generate(id, includeRaw, staleWhileRevalidate, deadline, firstHit, include, exclude)
     except findyoutubevideo.types.InvalidVideoIdError:
         return {"status": "bad.id", "id": None}
 
-async def wrapperYTS(id, includeRaw):
+async def wrapperYTS(id, includeRaw, staleWhileRevalidate=False, deadline=None, firstHit=False, include=None, exclude=None):
     """
     Wrapper for generateStream
     """
-    return await FYT_SESSION.generateStream(id, includeRaw)
+    return await FYT_SESSION.generateStream(id, includeRaw, staleWhileRevalidate, deadline, firstHit, include, exclude)
+
+def get_deadline():
+    """
+    Returns the deadline for this request in seconds: the `deadline` query parameter, or the default in config.yml.
+    Raises ValueError if the parameter isn't a positive number.
+    """
+    deadline = request.args.get("deadline")
+    if deadline is None:
+        return config.get("deadline")
+    deadline = float(deadline)
+    if not deadline > 0:
+        raise ValueError(deadline)
+    return deadline
+
+def check_selection(include, exclude):
+    """
+    Checks that an include/exclude selection is valid before anything is sent.
+    Raises ValueError (with a message for the client) if it isn't.
+    """
+    try:
+        findyoutubevideo.FytSession.select_services(include, exclude)
+    except findyoutubevideo.types.UnknownServiceError as ename:
+        raise ValueError(f"Unknown service or category: {ename}")
+    except findyoutubevideo.types.NoServicesSelectedError as ename:
+        raise ValueError(str(ename))
+
+def get_selection():
+    """
+    Returns the `include` and `exclude` query parameters as lists (or None if not given).
+    Each is a comma-separated list of class names, config IDs or categories.
+    Raises ValueError if any of them don't exist, or if they leave no services to run.
+    """
+    selection = []
+    for param in ("include", "exclude"):
+        value = request.args.get(param)
+        selection.append(None if value is None else [i for i in value.split(",") if i.strip()])
+    check_selection(*selection)
+    return selection
+
+@app.route("/api/v5/youtube/batch", methods=["POST"])
+async def youtube_batch():
+    """
+    Looks up many video IDs at once. Takes a JSON object with an `ids` list, and streams one line of JSON
+    per ID as each one finishes, then a summary line.
+    """
+    batch_config = config.get("batch") or {}
+    body = await request.get_json(force=True, silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("ids"), list):
+        return {"error": "Expected a JSON object with an ids list"}, 400
+    ids = body["ids"]
+    max_ids = batch_config.get("max_ids", 1000)
+    if len(ids) > max_ids:
+        return {"error": f"Too many IDs (the maximum is {max_ids})"}, 413
+    includeRaw = "includeRaw" in request.args
+    firstHit = "firstHit" in request.args
+    try:
+        deadline = get_deadline()
+    except ValueError:
+        return {"error": "deadline must be a positive number of seconds"}, 400
+    try:
+        include, exclude = get_selection()
+    except ValueError as ename:
+        return {"error": str(ename)}, 400
+
+    async def run():
+        summary = {"status": "summary", "total": 0, "ok": 0, "bad_id": 0, "error": 0,
+                   "verdict": {"video": 0, "metaonly": 0, "comments": 0, "not_found": 0}}
+        async for id, result in FYT_SESSION.generateBatch(
+            (str(id) for id in ids), includeRaw, concurrency=batch_config.get("concurrency", 8),
+            deadline=deadline, firstHit=firstHit, include=include, exclude=exclude
+        ):
+            summary["total"] += 1
+            if result is None:
+                summary["bad_id"] += 1
+                yield json.dumps({"id": id, "status": "bad.id"}).encode() + b"\n"
+            elif isinstance(result, Exception):
+                summary["error"] += 1
+                yield json.dumps({"id": id, "status": "error"}).encode() + b"\n"
+            else:
+                summary["ok"] += 1
+                verdict = result.verdict
+                if verdict["video"]:
+                    summary["verdict"]["video"] += 1
+                elif verdict["metaonly"]:
+                    summary["verdict"]["metaonly"] += 1
+                else:
+                    summary["verdict"]["not_found"] += 1
+                if verdict["comments"]:
+                    summary["verdict"]["comments"] += 1
+                yield serialization.encode_response(result) + b"\n"
+        yield json.dumps(summary).encode() + b"\n"
+    return run(), {"Content-Type": "application/x-ndjson"}
+
+def parse_ws_lookup(message: dict) -> dict:
+    """
+    Returns the generateStream keyword arguments for a lookup message sent to the WebSocket endpoint.
+    Raises ValueError (with a message for the client) if any of the options are invalid.
+    """
+    deadline = message.get("deadline", config.get("deadline"))
+    if deadline is not None and (isinstance(deadline, bool) or not isinstance(deadline, (int, float)) or not deadline > 0):
+        raise ValueError("deadline must be a positive number of seconds")
+    selection = {}
+    for key in ("include", "exclude"):
+        value = message.get(key)
+        if value is not None and not (isinstance(value, list) and all(isinstance(i, str) for i in value)):
+            raise ValueError(f"{key} must be a list of strings")
+        selection[key] = value
+    check_selection(**selection)
+    return {
+        "includeRaw": bool(message.get("includeRaw")),
+        "staleWhileRevalidate": bool(message.get("swr")),
+        "deadline": deadline,
+        "firstHit": bool(message.get("firstHit")),
+        **selection,
+    }
+
+@app.websocket("/api/v5/youtube/ws")
+async def youtube_ws():
+    """
+    Runs many lookups over one connection. The results of each are sent as they arrive, tagged with the video ID.
+    """
+    maxInFlight = (config.get("websocket") or {}).get("max_in_flight", 16)
+    lookups: dict[str, asyncio.Task] = {}
+
+    async def send_status(id, status, error=None):
+        message = {"id": id, "status": status}
+        if error is not None:
+            message["error"] = error
+        await websocket.send(json.dumps(message))
+
+    async def lookup(id, options):
+        try:
+            stream = await FYT_SESSION.generateStream(id, **options)
+            async for item in stream:
+                await websocket.send(serialization.encode_tagged(id, item).decode())
+        except asyncio.CancelledError:
+            raise
+        except Exception: # pylint: disable=broad-except
+            traceback.print_exc()
+            await send_status(id, "error", "An unexpected error occured")
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive())
+                if not isinstance(message, dict):
+                    raise ValueError
+                id = message.get("id")
+                action = message.get("action")
+            except ValueError:
+                await send_status(None, "error", "Expected a JSON object")
+                continue
+            if not isinstance(id, str):
+                await send_status(None, "error", "id must be a string")
+            elif action == "cancel":
+                task = lookups.pop(id, None)
+                if task is None:
+                    await send_status(id, "error", "No lookup in progress for this ID")
+                    continue
+                task.cancel()
+                await send_status(id, "cancelled")
+            elif action == "lookup":
+                if id in lookups:
+                    await send_status(id, "error", "A lookup is already in progress for this ID")
+                elif len(lookups) >= maxInFlight:
+                    await send_status(id, "error", f"Too many lookups in progress (the maximum is {maxInFlight})")
+                elif not FYT_SESSION.verifyId(id):
+                    await send_status(id, "bad.id")
+                else:
+                    try:
+                        options = parse_ws_lookup(message)
+                    except ValueError as ename:
+                        await send_status(id, "error", str(ename))
+                        continue
+                    task = lookups[id] = asyncio.create_task(lookup(id, options))
+                    task.add_done_callback(lambda task, id=id: lookups.pop(id) if lookups.get(id) is task else None)
+            else:
+                await send_status(id, "error", "action must be lookup or cancel")
+    finally:
+        # The client went away
+        tasks = list(lookups.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 @app.route("/api/v<int:v>/<site>/<id>")
 @app.route("/api/v<int:v>/<id>")
@@ -54,24 +243,36 @@ async def youtube(v, id, site="youtube", jsn=True):
     if site == "youtube":
         includeRaw = True
         stream = False
+        # Serve expired cached results immediately, and refresh them in the background
+        staleWhileRevalidate = "swr" in request.args
+        deadline = None
+        firstHit = False
+        include = exclude = None
         if v >= 4:
             stream = "stream" in request.args
             # Versions 4 and higher only provide `rawraw` if you ask for it
             includeRaw = "includeRaw" in request.args
+            # Stop at the first service that has the video
+            firstHit = "firstHit" in request.args
+            try:
+                deadline = get_deadline()
+            except ValueError:
+                return "deadline must be a positive number of seconds", 400
+            # Only run some of the services
+            try:
+                include, exclude = get_selection()
+            except ValueError as ename:
+                return str(ename), 400
         if stream:
-            async def run():
-                r = (await wrapperYTS(id, includeRaw=includeRaw)).coerce_to_api_version(v)
-                async for item in r:
-                    if type(item) == dict or item is None:
-                        yield json.dumps(item) + "\n"
-                    else:
-                        yield item.json() + "\n"
-            return run(), {"Content-Type": "application/json"}
+            r = await wrapperYTS(id, includeRaw, staleWhileRevalidate, deadline, firstHit, include, exclude)
+            return serialization.encode_stream(r, v), {"Content-Type": "application/json"}
         else:
-            r = (await wrapperYT(id, includeRaw=includeRaw)).coerce_to_api_version(v)
+            r = await wrapperYT(id, includeRaw, staleWhileRevalidate, deadline, firstHit, include, exclude)
+            if isinstance(r, dict):
+                return r
             if jsn:
-                return r.json(), {"Content-Type": "application/json"}
-            return r
+                return serialization.encode_response(r, v), {"Content-Type": "application/json"}
+            return r.coerce_to_api_version(v)
     return "Unrecognised site", 404
 
 @app.route("/noscript_init.html")
@@ -104,7 +305,7 @@ def get_enabled_methods():
     titles = []
     for service in findyoutubevideo.types.registry.get_services():
         if service.enabled():
-            titles.append(config_yml['methods'][service.configId]['title'])
+            titles.append(service.getName())
     return titles
 
 @app.route("/noscript_load.html")
@@ -127,6 +328,13 @@ async def coerce_to_id_endpoint():
         return '"Unable to find a video ID"', 400
     return {"data":id}
 
+@app.route("/api/metrics")
+async def metrics():
+    """
+    Counters for monitoring (cache hits and misses, etc.)
+    """
+    return FYT_SESSION.metrics()
+
 @app.route("/noscript_load_thing.html")
 async def load_thing():
     if not request.args.get("id"):
@@ -138,10 +346,7 @@ async def load_thing():
         (k for k in t.keys if k.error),
         (k for k in t.keys if not k.error and not k.archived)
     ))
-    return await render_template("noscript/fid.j2", resp=t, list=list, asd=dataclasses.asdict)
-
-head_insertion = findyoutubevideo.types.config_yml.get("additional_head")
-body_insertion = findyoutubevideo.types.config_yml.get("additional_body")
+    return await render_template("noscript/fid.j2", resp=t, list=list, asd=findyoutubevideo.LinkContains.asdict)
 
 @app.route("/")
 async def index():
@@ -162,8 +367,8 @@ async def index():
         default_id=default_id,
         methods=get_enabled_methods(),
         absolute_url=absolute_url,
-        head_insertion=head_insertion,
-        body_insertion=body_insertion,
+        head_insertion=config.get("additional_head"),
+        body_insertion=config.get("additional_body"),
     )
 
 # The following code should be taken out and shot
@@ -0,0 +1,79 @@
+"""
+Compares the dedicated JSON encoder with snscrape's generic dataclass encoder (which it replaced),
+on a response with hundreds of Wayback Machine format links.
+
+Run from the repository root (the package needs config.yml):
+    python benchmarks/bench_encoder.py [number of links]
+"""
+import dataclasses
+import json
+import sys
+import time
+import timeit
+
+sys.path.insert(0, ".")
+
+from findyoutubevideo import encoder
+from findyoutubevideo.types import Link, LinkContains, Response, Service
+
+# LinkContains used to be a dataclass, which is what snscrape's encoder needs. This is an equivalent one,
+# with the same name so that its `_type` comes out the same.
+LegacyLinkContains = dataclasses.make_dataclass(
+    "LinkContains", [(name, bool, False) for name in LinkContains.FIELDS], namespace={"__module__": LinkContains.__module__}
+)
+
+# Both versions of the response need the same timestamp
+NOW = time.time()
+
+def make_response(n_links: int, legacy: bool = False) -> Response:
+    """
+    Arguments:
+        legacy (bool): Use LegacyLinkContains, for snscrape's encoder.
+    """
+    contains = (LegacyLinkContains if legacy else LinkContains)(video=True, standalone_video=True)
+    links = []
+    formats = []
+    for i in range(n_links):
+        url = f"https://web.archive.org/web/20200101000000/https://rr1---sn-abc.googlevideo.com/videoplayback?itag={i}"
+        link = Link(url=url, contains=contains, title="Video (mp4)",
+                    note=f"avc1.4d401e video, mp4a.40.2 audio ({i})")
+        link.classname = "WaybackMachine"
+        links.append(link)
+        formats.append({"url": url, "timestamp": "20200101000000", "mimetype": "video/mp4", "itag": i})
+    service = Service(archived=True, lastupdated=NOW, name="Wayback Machine", note="",
+                      rawraw=(None, {"formats": formats}, None), metaonly=False, classname="WaybackMachine",
+                      available=links)
+    verdict = {"video": True, "metaonly": False, "comments": False, "human_friendly": "Archived! "}
+    return Response(id="dQw4w9WgXcQ", status="ok", keys=[service], verdict=verdict)
+
+def bench(name, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"{name:<24} {seconds * 1000:8.3f} ms")
+    return seconds
+
+def main():
+    n_links = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    response = make_response(n_links)
+    print(f"Response with {n_links} links, {len(encoder.dumps(response))} bytes")
+    number = 50
+    results = {}
+    try:
+        from snscrape.base import _JSONDataclass
+    except ImportError:
+        print("snscrape is not installed; skipping the baseline")
+    else:
+        legacy = make_response(n_links, legacy=True)
+        results["snscrape"] = bench("snscrape", lambda: _JSONDataclass.json(legacy), number)
+        assert _JSONDataclass.json(legacy).encode() == encoder.dumps(response)
+    results["encoder (json)"] = bench("encoder (json)", lambda: encoder.dumps(response), number)
+    if encoder.orjson is not None:
+        encoder.set_backend("orjson")
+        results["encoder (orjson)"] = bench("encoder (orjson)", lambda: encoder.dumps(response), number)
+        assert json.loads(encoder.dumps(response)) == json.loads(response.json())
+        encoder.set_backend("json")
+    if "snscrape" in results:
+        for name, seconds in results.items():
+            print(f"{name:<24} {results['snscrape'] / seconds:6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Measures how long it takes to import findyoutubevideo in a fresh interpreter, which is what every new
+Hypercorn worker pays on startup. The import is done from an empty directory, so it also checks that
+importing the package doesn't need config.yml.
+
+Run from the repository root:
+    python benchmarks/bench_import.py [number of runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+def import_once(package_dir: str, cwd: str) -> tuple[float, list[tuple[int, str]]]:
+    """
+    Imports the package in a new interpreter. Returns the total import time in seconds,
+    and the (cumulative microseconds, module) pairs reported by -X importtime.
+    """
+    code = f"import sys; sys.path.insert(0, {package_dir!r}); import findyoutubevideo"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.append((int(cumulative), name.strip()))
+    total = next(us for us, name in modules if name == "findyoutubevideo")
+    return total / 1e6, modules
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    package_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    with tempfile.TemporaryDirectory() as cwd:
+        times = []
+        for _ in range(runs):
+            seconds, modules = import_once(package_dir, cwd)
+            times.append(seconds)
+    print(f"import findyoutubevideo: median {statistics.median(times) * 1000:.1f} ms, "
+          f"min {min(times) * 1000:.1f} ms over {runs} runs")
+    print("Slowest top-level imports (last run):")
+    for us, name in sorted(modules, reverse=True)[:10]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Compares the merge loop in FytSession._generateStream with the one it replaced, which made two tasks and
+an asyncio.wait call for every item and passed them through a Queue(1).
+The services are stubs that yield links as fast as they can, so only the merging is measured.
+Reports items per second and how many tasks were created per lookup.
+
+Run from the repository root (the package needs config.yml):
+    python benchmarks/bench_merge.py [links per service] [lookups]
+"""
+import asyncio
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from findyoutubevideo import FytSession
+from findyoutubevideo.types import Link, LinkContains, Service
+
+SERVICES = FytSession._get_services()
+
+def make_items(service, n_links: int) -> list:
+    links = []
+    for i in range(n_links):
+        link = Link(url=f"https://example.com/{service.configId}/{i}", contains=LinkContains(video=True), title="Video")
+        link.classname = service.__name__
+        links.append(link)
+    result = Service(archived=False, lastupdated=time.time(), name=service.__name__, note="", rawraw=None,
+                     metaonly=False, classname=service.__name__, available=links)
+    return links + [result]
+
+async def old_merge(sources):
+    """
+    The loop that _generateStream used before, without the deadline and first-hit handling.
+    """
+    queue = asyncio.Queue(1)
+    done = asyncio.Event()
+    taskCount = len(sources)
+
+    async def iterate(gen):
+        nonlocal taskCount
+        try:
+            async for i in gen:
+                await queue.put(i)
+        finally:
+            taskCount -= 1
+            if taskCount <= 0:
+                done.set()
+
+    coroutines = [asyncio.create_task(iterate(gen)) for gen in sources]
+    while not done.is_set() or not queue.empty():
+        done_task = asyncio.create_task(done.wait())
+        queue_task = asyncio.create_task(queue.get())
+        done_tasks, _ = await asyncio.wait({done_task, queue_task}, return_when=asyncio.FIRST_COMPLETED)
+        if queue_task in done_tasks:
+            yield await queue_task
+        else:
+            queue_task.cancel()
+        done_task.cancel()
+    await asyncio.wait(coroutines, timeout=0)
+
+async def stub(items):
+    for item in items:
+        yield item
+
+def count_tasks():
+    loop = asyncio.get_running_loop()
+    counter = [0]
+    def factory(loop, coro, **kwargs):
+        counter[0] += 1
+        return asyncio.Task(coro, loop=loop, **kwargs)
+    loop.set_task_factory(factory)
+    return counter
+
+async def bench_old(items, lookups):
+    counter = count_tasks()
+    count = 0
+    start = time.perf_counter()
+    for _ in range(lookups):
+        async for _ in old_merge([stub(i) for i in items.values()]):
+            count += 1
+    return count, time.perf_counter() - start, counter[0]
+
+async def bench_new(items, lookups):
+    session = await FytSession.new()
+    session.cache = None
+    async def runService(service, *args):
+        for item in items[service]:
+            yield item
+    session._runService = runService
+    counter = count_tasks()
+    count = 0
+    start = time.perf_counter()
+    try:
+        for _ in range(lookups):
+            async for item in session._generateStream("dQw4w9WgXcQ", include=list(items)):
+                if isinstance(item, (Link, Service)):
+                    count += 1
+        return count, time.perf_counter() - start, counter[0]
+    finally:
+        asyncio.get_running_loop().set_task_factory(None)
+        await session.close()
+
+def main():
+    n_links = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    items = {service: make_items(service, n_links) for service in SERVICES}
+    print(f"{len(SERVICES)} services, {n_links} links each, {lookups} lookups")
+    for name, bench in (("old", bench_old), ("new", bench_new)):
+        count, seconds, tasks = asyncio.run(bench(items, lookups))
+        print(f"{name:<4} {count / seconds:12.0f} items/s {tasks / lookups:10.1f} tasks/lookup")
+
+if __name__ == "__main__":
+    main()
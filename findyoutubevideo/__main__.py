@@ -2,7 +2,7 @@ import asyncio
 
 import click
 
-from . import YouTubeResponse
+from . import FytSession, InvalidVideoIdError, NoServicesSelectedError, UnknownServiceError
 
 @click.group(help="CLI tool to search for archived YouTube content")
 def main():
@@ -13,18 +13,44 @@ def main():
         - 2: One or more operations failed.
     """
 
+def split_services(values: tuple[str]):
+    """
+    Flattens repeated, comma-separated --include/--exclude options into one list, or None if there were none.
+    """
+    if not values:
+        return None
+    return [i for value in values for i in value.split(",") if i.strip()]
+
+async def generate(id: str, include, exclude):
+    session = await FytSession.new()
+    try:
+        return await session.generate(id, include=include, exclude=exclude)
+    finally:
+        await session.close()
+
 @click.command
 @click.option("--format", default="text", help="Selects which format to output to stdout.", type=click.Choice(["json", "text"]))
+@click.option("--include", multiple=True, help="Only run these services (class names, config IDs or categories; comma-separated or repeated).")
+@click.option("--exclude", multiple=True, help="Don't run these services (same format as --include).")
 @click.argument("id")
 @click.pass_context
-def youtube(ctx, id: str, format: str) -> int:
+def youtube(ctx, id: str, format: str, include: tuple[str], exclude: tuple[str]) -> int:
     """
     Parses CLI arguments and returns the Response for the video ID <IDENT>.
     """
     click.echo("\033[1m\033[4m\033[1;31m* The command-line interface is unstable and does not include all features.\033[0m", err=True)
+    include = split_services(include)
+    exclude = split_services(exclude)
+    try:
+        FytSession.select_services(include, exclude)
+    except UnknownServiceError as ename:
+        raise click.BadParameter(f"Unknown service or category: {ename}")
+    except NoServicesSelectedError as ename:
+        raise click.BadParameter(str(ename))
     click.echo("Generating report, this could take some time...", err=True)
-    response = asyncio.run(YouTubeResponse.generate(id))
-    if response.status == "bad.id":
+    try:
+        response = asyncio.run(generate(id, include, exclude))
+    except InvalidVideoIdError:
         raise ValueError("Bad video ID - does not match regex")
     if format == "json":
         click.echo(response.json())
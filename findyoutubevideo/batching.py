@@ -0,0 +1,102 @@
+"""
+Batching of lookups, for services whose API can answer for many videos in one request.
+"""
+import asyncio
+import typing_extensions as typing
+
+class Batcher:
+    """
+    Collects the keys (usually video IDs) that are submitted within a short window of each other, and
+    fetches them with one call. Each caller gets the result for its own key.
+    """
+    def __init__(
+        self, fetch: typing.Callable[[list], typing.Awaitable[dict]], window: float = 0.05, max_size: int = 50,
+        gate: typing.Optional[typing.Callable[[], typing.Awaitable]] = None
+    ):
+        """
+        Arguments:
+            fetch (Callable): Coroutine function that takes a list of keys and returns a dict of key to result.
+                If it raises, every caller in the batch gets the exception.
+            window (float): How long to wait for more keys after the first one arrives, in seconds.
+            max_size (int): The most keys to fetch at once. A batch is sent straight away once it is full.
+            gate (Callable): Optional coroutine function that is awaited before each batch is taken, for services
+                that only allow a request every so often. Keys keep collecting while it waits, so each slot
+                is used for as many keys as possible.
+        """
+        self.fetch = fetch
+        self.window = window
+        self.max_size = max(1, max_size)
+        self.gate = gate
+        self.draining = False
+        self.pending: dict[typing.Any, list[asyncio.Future]] = {}
+        self.timer: typing.Optional[asyncio.TimerHandle] = None
+        self.tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.keys = 0
+
+    async def submit(self, key):
+        """
+        Adds a key to the next batch and waits for its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(key, []).append(future)
+        if self.draining:
+            # It will be picked up by the next batch
+            pass
+        elif len(self.pending) >= self.max_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.gate is not None:
+            if not self.draining:
+                self.draining = True
+                self._startTask(self._drain())
+            return
+        while self.pending:
+            self._startTask(self._run(self._take()))
+
+    async def _drain(self):
+        try:
+            while self.pending:
+                await self.gate()
+                self._startTask(self._run(self._take()))
+        finally:
+            self.draining = False
+
+    def _take(self) -> dict[typing.Any, list[asyncio.Future]]:
+        keys = list(self.pending)[:self.max_size]
+        return {key: self.pending.pop(key) for key in keys}
+
+    def _startTask(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch: dict[typing.Any, list[asyncio.Future]]):
+        self.batches += 1
+        self.keys += len(batch)
+        try:
+            results = await self.fetch(list(batch))
+        except Exception as ename: # pylint: disable=broad-except
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(ename)
+            return
+        for key, futures in batch.items():
+            for future in futures:
+                if future.done():
+                    continue
+                if key in results:
+                    future.set_result(results[key])
+                else:
+                    future.set_exception(KeyError(key))
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "keys": self.keys}
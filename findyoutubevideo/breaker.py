@@ -0,0 +1,88 @@
+"""
+Circuit breakers, so that a service whose upstream is down fails straight away instead of making every
+lookup wait for it to time out.
+"""
+import time
+
+import typing_extensions as typing
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    # How many runs in a row have to fail before the breaker opens
+    "failure_threshold": 5,
+    # How long the breaker stays open before a lookup is let through to try the service again, in seconds
+    "reset_timeout": 30,
+}
+
+class CircuitBreaker:
+    """
+    The breaker for one service. It is closed while the service works, opens after too many failures in a
+    row, and after `reset_timeout` lets a single trial run through (half-open). If the trial works, it closes
+    again; otherwise it opens for another `reset_timeout`.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, settings: dict):
+        """
+        Arguments:
+            settings (dict): DEFAULT_SETTINGS, with any changes from config.yml applied.
+        """
+        self.settings = settings
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: typing.Optional[float] = None
+        self.trips = 0
+        self.fast_fails = 0
+
+    def allow(self) -> bool:
+        """
+        Returns whether the service should be run. If the breaker is open and it is time for a trial run,
+        this lets exactly one through; its result has to be reported with `record`.
+        """
+        if not self.settings["enabled"] or self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() >= self.opened_at + self.settings["reset_timeout"]:
+            self.state = self.HALF_OPEN
+            return True
+        self.fast_fails += 1
+        return False
+
+    def record(self, success: typing.Optional[bool]):
+        """
+        Reports the outcome of a run. None means it was cancelled, which doesn't count either way.
+        """
+        if success is None:
+            if self.state == self.HALF_OPEN:
+                # Let the next lookup try again
+                self.state = self.OPEN
+            return
+        if success:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.settings["failure_threshold"]:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def retry_in(self) -> float:
+        """
+        Returns how long it is until the next trial run, in seconds.
+        """
+        if self.opened_at is None:
+            return 0
+        return max(0, self.opened_at + self.settings["reset_timeout"] - time.monotonic())
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": self.retry_in() if self.state == self.OPEN else None,
+            "trips": self.trips,
+            "fast_fails": self.fast_fails,
+        }
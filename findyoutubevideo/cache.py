@@ -0,0 +1,345 @@
+"""
+Caching of per-service results, so that repeated lookups of the same video don't hit every service again.
+"""
+import asyncio
+import collections
+import dataclasses
+import json
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+import typing_extensions as typing
+
+# Used when neither the global `cache` section nor the method's own `cache` section sets a value.
+DEFAULT_TTLS = {
+    "positive_ttl": 3600,
+    "negative_ttl": 600,
+    "error_ttl": 30,
+}
+
+def approximate_size(obj) -> int:
+    """
+    Roughly estimates how many bytes an object takes up. This is not exact; it only has to be
+    good enough to stop huge `rawraw` payloads from filling up the cache.
+    """
+    if obj is None or isinstance(obj, (bool, int, float)):
+        return 8
+    if isinstance(obj, (str, bytes)):
+        return 48 + len(obj)
+    if isinstance(obj, dict):
+        return 64 + sum(approximate_size(k) + approximate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return 56 + sum(approximate_size(i) for i in obj)
+    if dataclasses.is_dataclass(obj):
+        return 64 + sum(approximate_size(getattr(obj, f.name, None)) for f in dataclasses.fields(obj))
+    return 64
+
+@dataclasses.dataclass
+class CacheEntry:
+    """
+    A cached service result.
+
+    Attributes:
+        service (Service): The final Service object, including its raw data.
+        links (list[Link]): The links that were yielded before the Service object.
+        expires (float): When the entry stops being fresh. Stale entries are only served in stale-while-revalidate mode.
+        size (int): The approximate size of the entry in bytes.
+    """
+    service: typing.Any
+    links: list
+    expires: float
+    size: int
+
+    def is_fresh(self) -> bool:
+        return self.expires > time.time()
+
+class SqliteResultStore:
+    """
+    Stores serialized service results in an SQLite database, so that they can be shared between
+    Hypercorn workers and survive restarts.
+    The database is in WAL mode, so readers don't block the writer, even in another process.
+    Reads use a connection shared between threads, which a lock serializes. Writes are queued and done by a
+    background thread with its own connection, so nobody waits for them (or for the clean-ups that follow
+    every so many writes).
+    """
+    def __init__(self, path: str, max_bytes: int = 1024 * 1024 * 1024, vacuum_interval: int = 256, stale_ttl: float = 0,
+                 max_pending: int = 1024):
+        """
+        Arguments:
+            path (str): The path to the database file. It is created if it doesn't exist.
+            max_bytes (int): When the stored data grows past this, the oldest entries are deleted.
+            vacuum_interval (int): How many writes to do between removing expired entries and enforcing max_bytes.
+            stale_ttl (float): How long to keep entries after they expire, for stale-while-revalidate mode.
+            max_pending (int): How many writes can be queued. If the writer falls further behind than this,
+                new results aren't stored.
+        """
+        self.path = path
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.vacuum_interval = vacuum_interval
+        self.writes = 0
+        self.dropped = 0
+        self.pending: queue.Queue = queue.Queue(max_pending)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            # auto_vacuum only has an effect if it is set before the first table is created.
+            self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    service TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    expires REAL NOT NULL,
+                    stored REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (service, id)
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_stored ON results (stored)")
+        self.writer = threading.Thread(target=self._write, name="fyt-cache-writer", daemon=True)
+        self.writer.start()
+
+    def _get(self, service: str, id: str, grace: float) -> typing.Optional[tuple[float, str]]:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT expires, data FROM results WHERE service = ? AND id = ? AND expires > ?",
+                (service, id, time.time() - grace)
+            ).fetchone()
+
+    def _write(self):
+        """
+        The writer thread: stores queued results until it is given None.
+        """
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        connection.execute("PRAGMA synchronous = NORMAL")
+        try:
+            while (item := self.pending.get()) is not None:
+                try:
+                    self._put(connection, *item)
+                except (TypeError, ValueError):
+                    # The raw data isn't JSON-serializable. Don't bother storing it.
+                    pass
+                except sqlite3.Error:
+                    traceback.print_exc()
+                finally:
+                    self.pending.task_done()
+        finally:
+            self.pending.task_done()
+            connection.close()
+
+    def _put(self, connection: sqlite3.Connection, service: str, id: str, expires: float, cached: dict):
+        data = json.dumps(cached)
+        connection.execute(
+            "INSERT OR REPLACE INTO results (service, id, expires, stored, size, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (service, id, expires, time.time(), len(data), data)
+        )
+        self.writes += 1
+        if self.writes % self.vacuum_interval == 0:
+            self._vacuum(connection)
+
+    def _vacuum(self, connection: sqlite3.Connection):
+        """
+        Removes expired entries, then the oldest entries until the total size is below max_bytes.
+        """
+        connection.execute("DELETE FROM results WHERE expires <= ?", (time.time() - self.stale_ttl,))
+        total, = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            oldest = []
+            for rowid, size in connection.execute("SELECT rowid, size FROM results ORDER BY stored"):
+                oldest.append((rowid,))
+                excess -= size
+                if excess <= 0:
+                    break
+            connection.executemany("DELETE FROM results WHERE rowid = ?", oldest)
+        connection.execute("PRAGMA incremental_vacuum")
+
+    async def get(self, service_cls, id: str, allowStale: bool = False):
+        """
+        Returns (service, links, expires) for that service and video ID, or None if there isn't a valid entry.
+        If allowStale is True, entries that expired less than stale_ttl seconds ago are also returned.
+        """
+        row = await asyncio.to_thread(self._get, service_cls.__name__, id, self.stale_ttl if allowStale else 0)
+        if row is None:
+            return None
+        expires, data = row
+        service, links = service_cls.from_cache(json.loads(data))
+        return service, links, expires
+
+    def put(self, service_cls, id: str, service, expires: float):
+        """
+        Queues a result to be stored, without waiting for it.
+        """
+        try:
+            self.pending.put_nowait((service_cls.__name__, id, expires, service.to_cache()))
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {"writes": self.writes, "pending": self.pending.qsize(), "dropped": self.dropped}
+
+    def close(self):
+        """
+        Stores whatever is still queued, then stops the writer. This blocks, so run it in a thread from async code.
+        """
+        self.pending.put(None)
+        self.writer.join()
+        with self.lock:
+            self.connection.close()
+
+class ResultCache:
+    """
+    A bounded in-memory cache of service results, keyed by (service class, video ID).
+    Entries are evicted when they expire, or least-recently-used first when there are
+    more than `max_entries` entries or more than `max_bytes` (approximate) bytes stored.
+    If a `store` is given, results are also written to it, and looked up there when they aren't in memory.
+    Expired entries are kept for another `stale_ttl` seconds, so they can be served in stale-while-revalidate mode.
+    """
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024,
+                 ttls: typing.Optional[dict] = None, serviceTtls: typing.Optional[dict] = None,
+                 store: typing.Optional[SqliteResultStore] = None, stale_ttl: float = 0):
+        """
+        Arguments:
+            max_entries (int): The maximum number of entries to keep.
+            max_bytes (int): The maximum approximate size of all entries combined.
+            ttls (dict): The default positive_ttl, negative_ttl and error_ttl values.
+            serviceTtls (dict): Overrides for those values, keyed by configId.
+            store (SqliteResultStore): An optional persistent second tier.
+            stale_ttl (float): How long to keep entries after they expire.
+        """
+        self.store = store
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = DEFAULT_TTLS | (ttls or {})
+        self.serviceTtls = serviceTtls or {}
+        self.entries: collections.OrderedDict[tuple, CacheEntry] = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.store_hits = 0
+        self.store_errors = 0
+        self.stale_hits = 0
+
+    @classmethod
+    def from_config(cls, cacheConfig: dict, methods: dict):
+        """
+        Creates a ResultCache from the `cache` section of config.yml, and the `cache` section of each method.
+        Returns None if caching is disabled.
+        """
+        if not cacheConfig.get("enabled", True):
+            return None
+        ttls = {k: v for k, v in cacheConfig.items() if k in DEFAULT_TTLS}
+        serviceTtls = {configId: method["cache"] for configId, method in methods.items() if method.get("cache")}
+        stale_ttl = cacheConfig.get("stale_ttl", 86400)
+        store = None
+        if path := cacheConfig.get("sqlite_path"):
+            store = SqliteResultStore(
+                path, max_bytes=cacheConfig.get("sqlite_max_bytes", 1024 * 1024 * 1024), stale_ttl=stale_ttl
+            )
+        return cls(
+            max_entries=cacheConfig.get("max_entries", 4096),
+            max_bytes=cacheConfig.get("max_bytes", 64 * 1024 * 1024),
+            ttls=ttls, serviceTtls=serviceTtls, store=store, stale_ttl=stale_ttl,
+        )
+
+    def ttl_for(self, service_cls, service) -> float:
+        """
+        Returns how long a result should be cached for, depending on whether it was found, not found, or an error.
+        """
+        ttls = self.ttls | self.serviceTtls.get(service_cls.configId, {})
+        if service.error:
+            return ttls["error_ttl"]
+        if service.archived:
+            return ttls["positive_ttl"]
+        return ttls["negative_ttl"]
+
+    async def get(self, service_cls, id: str, allowStale: bool = False) -> typing.Optional[CacheEntry]:
+        """
+        Returns the cached entry for that service and video ID, or None if there isn't a valid one.
+        If allowStale is True, an expired entry may be returned; check `is_fresh()`.
+        """
+        key = (service_cls, id)
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires + self.stale_ttl <= now:
+            self._remove(key)
+            entry = None
+        if (entry is None or entry.expires <= now) and self.store:
+            # Another worker might have a fresher result.
+            try:
+                stored = await self.store.get(service_cls, id, allowStale)
+            except Exception: # pylint: disable=broad-except
+                # e.g. the database is locked, or the row was stored by an incompatible version
+                traceback.print_exc()
+                self.store_errors += 1
+                stored = None
+            if stored:
+                service, links, expires = stored
+                if entry is None or expires > entry.expires:
+                    entry = self._put(service_cls, id, service, links, expires)
+                    self.store_hits += 1
+        if entry is None or (entry.expires <= now and not allowStale):
+            self.misses += 1
+            return None
+        if key in self.entries:
+            # It may have been evicted by another lookup while this one was reading the store
+            self.entries.move_to_end(key)
+        if entry.expires <= now:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def put(self, service_cls, id: str, service, links: list):
+        """
+        Stores a result, unless its TTL is zero.
+        """
+        ttl = self.ttl_for(service_cls, service)
+        if ttl <= 0:
+            return
+        expires = time.time() + ttl
+        self._put(service_cls, id, service, links, expires)
+        if self.store:
+            self.store.put(service_cls, id, service, expires)
+
+    def _put(self, service_cls, id: str, service, links: list, expires: float) -> typing.Optional[CacheEntry]:
+        key = (service_cls, id)
+        if key in self.entries:
+            self._remove(key)
+        size = approximate_size(service.rawraw) + sum(approximate_size(link) for link in links) + 512
+        if size > self.max_bytes:
+            return None
+        entry = self.entries[key] = CacheEntry(service=service, links=links, expires=expires, size=size)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+        return entry
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "store_hits": self.store_hits,
+            "store_errors": self.store_errors,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "store": self.store.stats() if self.store else None,
+        }
+
+    def close(self):
+        if self.store:
+            self.store.close()
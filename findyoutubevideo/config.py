@@ -0,0 +1,59 @@
+"""
+Access to config.yml. The file isn't read until a setting is first needed, so importing the package has
+no side effects and doesn't need a config file.
+"""
+import typing_extensions as typing
+
+class Config:
+    """
+    The parsed configuration. Use the module-level `config` instance rather than creating your own.
+    """
+    def __init__(self, path: str = "config.yml"):
+        self.path = path
+        self._data: typing.Optional[dict] = None
+
+    def load(self, path: typing.Optional[str] = None, data: typing.Optional[dict] = None):
+        """
+        Switches to another configuration. If `data` is given, it is used instead of reading a file.
+        Most settings, such as whether a method is enabled, its title and its own options, are read whenever
+        they are used, so the change applies to running FytSessions straight away. The settings a FytSession
+        reads when it is created (connection pools, rate limits, the cache and the batch limit) only change for
+        sessions created afterwards.
+        """
+        if path is not None:
+            self.path = path
+        self._data = data
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            import yaml
+            with open(self.path, 'r') as file:
+                self._data = yaml.safe_load(file)
+        return self._data
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    @property
+    def methods(self) -> dict[str, dict]:
+        return self.data["methods"]
+
+    def method(self, configId: str) -> dict:
+        """
+        Returns the configuration of a single method (service).
+        """
+        return self.methods[configId]
+
+    @property
+    def user_agent(self) -> typing.Optional[str]:
+        return self.data.get("user_agent") # defaults to None if not set
+
+    @property
+    def experiment_base_url(self) -> typing.Optional[str]:
+        experiment_base_url = self.data.get("experiment_base_url")
+        if experiment_base_url:
+            experiment_base_url = experiment_base_url.rstrip("/")
+        return experiment_base_url
+
+config = Config()
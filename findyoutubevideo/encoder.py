@@ -0,0 +1,127 @@
+"""
+A JSON encoder for the response dataclasses.
+The output is the same as `json.dumps` of the dict that snscrape's `_JSONDataclass.json` used to build
+(including the `_type` field), but it is written straight into a bytes buffer, using a field plan that
+is computed once per class instead of walking the dataclass fields on every call.
+"""
+import dataclasses
+import datetime
+import json
+import json.encoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encodeString = json.encoder.encode_basestring_ascii
+
+def _defaultLeaf(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return json.loads(dumps(obj))
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+_stdlibEncode = json.JSONEncoder(default=_defaultLeaf).encode
+
+def _stdlibLeaf(buf: bytearray, value):
+    buf += _stdlibEncode(value).encode()
+
+def _orjsonLeaf(buf: bytearray, value):
+    buf += orjson.dumps(value, default=_defaultLeaf, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+# Values that aren't one of the response dataclasses (mostly `rawraw`) are written by this.
+# By default it is the standard library's encoder, which uses its C accelerator.
+_leafWriter = _stdlibLeaf
+
+def set_backend(name: str):
+    """
+    Selects the encoder used for values that aren't response dataclasses, such as `rawraw`.
+    Arguments:
+        name (str): "json" (the default; the output is identical to json.dumps) or "orjson". orjson is faster
+            with large raw payloads, but it doesn't add spaces or escape non-ASCII characters, so those parts
+            of the output are formatted differently. Falls back to "json" if orjson isn't installed.
+    """
+    global _leafWriter
+    _leafWriter = _orjsonLeaf if name == "orjson" and orjson is not None else _stdlibLeaf
+
+class _Plan:
+    """
+    How to encode one class: the opening of the object, and the key prefix for every field that is output.
+    """
+    __slots__ = ("start", "fields")
+
+    def __init__(self, cls):
+        self.start = ('{"_type": ' + _encodeString(f"{cls.__module__}.{cls.__name__}")).encode()
+        self.fields = tuple(
+            (field.name, (", " + _encodeString(field.name) + ": ").encode())
+            for field in dataclasses.fields(cls) if not field.name.startswith("_")
+        )
+
+_plans: dict[type, _Plan] = {}
+
+def _plan(cls) -> _Plan:
+    plan = _plans.get(cls)
+    if plan is None:
+        plan = _plans[cls] = _Plan(cls)
+    return plan
+
+def _writeFloat(buf: bytearray, value: float):
+    if value != value or value in (float("inf"), float("-inf")):
+        # Same as json.dumps
+        _leafWriter(buf, value)
+    else:
+        buf += float.__repr__(value).encode()
+
+def _writeList(buf: bytearray, value):
+    buf += b"["
+    first = True
+    for item in value:
+        if not first:
+            buf += b", "
+        first = False
+        _write(buf, item)
+    buf += b"]"
+
+_writers = {
+    str: lambda buf, value: buf.extend(_encodeString(value).encode()),
+    bool: lambda buf, value: buf.extend(b"true" if value else b"false"),
+    int: lambda buf, value: buf.extend(int.__repr__(value).encode()),
+    float: _writeFloat,
+    type(None): lambda buf, value: buf.extend(b"null"),
+}
+
+def _write(buf: bytearray, value):
+    cls = type(value)
+    writer = _writers.get(cls)
+    if writer is not None:
+        writer(buf, value)
+    elif hasattr(cls, "__json_write__"):
+        # The class knows how to write itself
+        value.__json_write__(buf)
+    elif dataclasses.is_dataclass(cls):
+        write_dataclass(buf, value)
+    elif cls in (list, tuple) and any(dataclasses.is_dataclass(item) or hasattr(item, "__json_write__") for item in value):
+        _writeList(buf, value)
+    else:
+        _leafWriter(buf, value)
+
+def write_dataclass(buf: bytearray, obj):
+    """
+    Writes a dataclass instance into the buffer.
+    """
+    plan = _plan(type(obj))
+    buf += plan.start
+    for name, prefix in plan.fields:
+        buf += prefix
+        _write(buf, getattr(obj, name))
+    buf += b"}"
+
+def dumps(obj) -> bytes:
+    """
+    Encodes a response dataclass (or anything else JSON-serializable) into JSON bytes.
+    """
+    buf = bytearray()
+    _write(buf, obj)
+    return bytes(buf)
@@ -2,14 +2,12 @@
 All the Service implementations live here.
 """
 
-import random, time, aiohttp, asyncio
-import typing_extensions as typing
-from .types import FytSession, Link, LinkContains, Service, methods, experiment_base_url, registry
-from yarl import URL
-import wikitextparser
+import random, time, asyncio
+from .config import config
+from .types import FytSession, Link, LinkContains, Service, registry
 
 async def submit_experiment(session: FytSession, experiment_name: str, video_id: str, **report):
-    if experiment_base_url:
+    if experiment_base_url := config.experiment_base_url:
         report |= {
             "experiment": experiment_name,
             "id": video_id,
@@ -25,8 +23,8 @@ class YouTube(Service):
     Checks if the video is still available on YouTube.
     Thumbnail method has a few edge cases but seems the most reliable for all tested cases.
     """
-    name = methods["youtube"]["title"]
     configId = "youtube"
+    hosts = ("i.ytimg.com",)
 
     @classmethod
     async def _run(cls, id, session: FytSession):
@@ -62,20 +60,60 @@ class YouTube(Service):
 
 @registry.ia
 class WaybackMachine(Service):
-    name = methods["ia_wayback"]["title"]
     configId = "ia_wayback"
+    hosts = ("web.archive.org", "archive.org")
 
     @classmethod
     async def _run(cls, id: str, session: FytSession):
+        import aiohttp
+        from yarl import URL
         ismeta = False
         archived = False
+        response2 = None
+        url_formats = [
+            f"youtube.com/watch?v={id}",
+            f"youtube.com/embed/{id}",
+            f"youtube.com/shorts/{id}",
+            f"youtu.be/{id}"
+        ]
+
+        async def getJson(url, params, timeout):
+            async with session.get(url, params=params, timeout=timeout) as response:
+                return await response.json()
+
+        async def getRedirect(url):
+            async with session.head(url, allow_redirects=False, timeout=15) as response:
+                return response.headers.get("location")
+
+        # Every step is started straight away, and the results are used in the same order as before.
+        # Steps that turn out not to be needed are cancelled.
+        fakeurl = f"https://web.archive.org/web/0id_/http://wayback-fakeurl.archive.org/yt/{id}"
+        videoinfoTask = asyncio.create_task(getJson("https://web.archive.org/__wb/videoinfo", {"vtype": "youtube", "vid": id}, 5))
+        fakeurlTask = asyncio.create_task(getRedirect(fakeurl))
+        cdxTasks = [
+            asyncio.create_task(getJson(
+                "https://web.archive.org/cdx/search/cdx",
+                {"url": check, "collapse": "urlkey", "filter": "statuscode:200", "output": "json"},
+                15
+            ))
+            for check in url_formats
+        ]
+        availableTasks = [
+            asyncio.create_task(getJson("https://archive.org/wayback/available", {"url": check, "timestamp": 0}, 15))
+            for check in url_formats
+        ]
+        tasks = [videoinfoTask, fakeurlTask, *cdxTasks, *availableTasks]
+
+        def cancel(tasks):
+            for task in tasks:
+                task.cancel()
 
-        params = {"vtype": "youtube", "vid": id}
-        async with session.get("https://web.archive.org/__wb/videoinfo", params=params, timeout=5) as response:
-            viresp = await response.json()
+        try:
+            viresp = await videoinfoTask
             videoinfo_archived = bool(viresp.get("formats"))
             if videoinfo_archived:
                 archived = True
+                cancel([fakeurlTask, *availableTasks])
                 formats = viresp['formats']
                 processed_formats = []
 
@@ -135,73 +173,59 @@ class WaybackMachine(Service):
                         note = note,
                     )
 
-        # fakeurl fallback
-        if not archived:
-            lien = f"https://web.archive.org/web/0id_/http://wayback-fakeurl.archive.org/yt/{id}"
-            async with session.head(lien, allow_redirects=False, timeout=15) as response:
-                redirect = response.headers.get("location")
+            # fakeurl fallback
+            if not archived:
+                redirect = await fakeurlTask
                 archived = bool(redirect)
                 if redirect:
                     assert URL(redirect) != "/sry", "Redirected to sorry page. Is IA down?"
                 fakeurl_archived = archived
                 if fakeurl_archived:
+                    cancel(availableTasks)
                     yield Link(
-                        url = lien,
+                        url = fakeurl,
                         contains = LinkContains(video = True, standalone_video = True),
                         title = "Video",
                         note = "A backup endpoint was used. More formats may be available later.",
                     )
                     await submit_experiment(session, "wb-vi-failures", id, fakeurl=fakeurl_archived, videoinfo=videoinfo_archived, viresp=viresp)
 
-        response2 = None
-        url_formats = [
-            f"youtube.com/watch?v={id}",
-            f"youtube.com/embed/{id}",
-            f"youtube.com/shorts/{id}",
-            f"youtu.be/{id}"
-        ]
-
-        # CDX above Availability because currently, latter will return text/html MIME type,
-        # which causes the script to unalive itself, prematurely
-        for check in url_formats:
-            params = {
-                "url": check,
-                "collapse": "urlkey",
-                "filter": "statuscode:200",
-                "output": "json"
-            }
-            try:
-                async with session.get("https://web.archive.org/cdx/search/cdx", params=params, timeout=15) as cdx_resp:
-                    cdx_results = await cdx_resp.json()
-                    if cdx_results:
-                        lien = f"https://web.archive.org/web/{cdx_results[1][1]}/{cdx_results[1][2]}"
-                        yield Link(
-                            url = lien,
-                            contains = LinkContains(metadata = True),
-                            title = "Watch page (may not work)"
-                        )
-                        if not archived:
-                            ismeta = True
-                        archived = True
-                        break
-            except (aiohttp.ClientError, asyncio.TimeoutError):
-                continue
+            # CDX above Availability because currently, latter will return text/html MIME type,
+            # which causes the script to unalive itself, prematurely
+            # The first URL format (in list order) that has a capture wins.
+            for index, cdxTask in enumerate(cdxTasks):
+                try:
+                    cdx_results = await cdxTask
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    continue
+                if cdx_results:
+                    cancel(cdxTasks[index + 1:] + availableTasks)
+                    lien = f"https://web.archive.org/web/{cdx_results[1][1]}/{cdx_results[1][2]}"
+                    yield Link(
+                        url = lien,
+                        contains = LinkContains(metadata = True),
+                        title = "Watch page (may not work)"
+                    )
+                    if not archived:
+                        ismeta = True
+                    archived = True
+                    break
 
-        # remove this?
-        if not archived:
-            lien = None
-            for check in url_formats:
-                params = {
-                    "url": check,
-                    "timestamp": 0
-                }
-                async with session.get("https://archive.org/wayback/available", params=params, timeout=15) as resp:
-                    response2 = await resp.json()
+            # remove this?
+            if not archived:
+                lien = None
+                for index, availableTask in enumerate(availableTasks):
+                    response2 = await availableTask
                     if response2.get("archived_snapshots"):
+                        cancel(availableTasks[index + 1:])
                         archived = True
                         ismeta = True
                         lien = response2["archived_snapshots"]["closest"]["url"]
                         break
+        finally:
+            cancel(tasks)
+            # Don't leave exceptions from skipped steps unretrieved
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         rawraw = (None, viresp, response2)
         yield cls(
@@ -213,8 +237,8 @@ class WaybackMachine(Service):
 
 @registry.ia
 class ArchiveOrgDetails(Service):
-    name = methods["ia_details"]["title"]
     configId = "ia_details"
+    hosts = ("archive.org", "fyt-helper.thetechrobo.ca")
     items_tried = [
         "youtube-%s",
         "youtube_%s",
@@ -226,31 +250,48 @@ class ArchiveOrgDetails(Service):
         responses = []
         is_dark = False
         archived = False
-        for template in cls.items_tried:
-            ident = template % id
+        templates = cls.items_tried + (config.method(cls.configId).get("extra_identifiers") or [])
+
+        async def getMetadata(ident):
             async with session.get(f"https://archive.org/metadata/{ident}", timeout=12) as resp:
-                metadata = await resp.json()
-            responses.append(metadata)
-            if metadata.get("is_dark"):
-                is_dark = True
-            if metadata and (not metadata.get("is_dark")):
-                is_dark = False
-                archived = True
-                yield Link(
-                    url = f"https://archive.org/details/{ident}",
-                    # We don't know what it has, so assume it has everything
-                    contains = LinkContains(True, True, True, True, True),
-                    title = "Item"
-                )
-        rawraw = responses
-        note = ""
+                return await resp.json()
+
+        async def getHelper():
+            # Helper source code is at endpoint /source_code
+            helper_url = f"https://fyt-helper.thetechrobo.ca/ia_extra/{id}"
+            async with session.get(helper_url) as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                elif resp.status == 404:
+                    return None
+                else:
+                    raise AssertionError("fyt-helper check failed")
+
+        # All of the requests are sent at once, but the results are handled in order
+        idents = [template % id for template in templates]
+        metadataTasks = [asyncio.create_task(getMetadata(ident)) for ident in idents]
+        helperTask = asyncio.create_task(getHelper())
+        try:
+            for ident, metadataTask in zip(idents, metadataTasks):
+                metadata = await metadataTask
+                responses.append(metadata)
+                if metadata.get("is_dark"):
+                    is_dark = True
+                if metadata and (not metadata.get("is_dark")):
+                    is_dark = False
+                    archived = True
+                    yield Link(
+                        url = f"https://archive.org/details/{ident}",
+                        # We don't know what it has, so assume it has everything
+                        contains = LinkContains(True, True, True, True, True),
+                        title = "Item"
+                    )
+            rawraw = responses
+            note = ""
 
-        # Helper source code is at endpoint /source_code
-        helper_url = f"https://fyt-helper.thetechrobo.ca/ia_extra/{id}"
-        async with session.get(helper_url) as resp:
-            if resp.status == 200:
+            j = await helperTask
+            if j is not None:
                 archived = True
-                j = await resp.json()
                 lien = f"https://archive.org/details/{j['item']}"
                 lnote = "This is a generic channel item. It may contain multiple videos."
                 yield Link(
@@ -259,10 +300,11 @@ class ArchiveOrgDetails(Service):
                     title = "Item",
                     note = lnote,
                 )
-            elif resp.status == 404:
-                pass
-            else:
-                raise AssertionError("fyt-helper check failed")
+        finally:
+            tasks = [*metadataTasks, helperTask]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         if not archived:
             note = "Even if it isn't found here, it might still be in the Internet Archive. This site only checks for certain item identifiers."
@@ -279,8 +321,28 @@ class ArchiveOrgCDX(Service):
     """
     Queries the Archive.org CDX for an archived video thumb
     """
-    name = methods["ia_cdx"]["title"]
     configId = "ia_cdx"
+    hosts = ("web.archive.org",)
+    quality_order = (
+        'maxresdefault.jpg',
+        'sddefault.jpg',
+        'hqdefault.jpg',
+        '0.jpg',
+        'high.jpg',
+        'mqdefault.jpg',
+        'medium.jpg',
+        'default.jpg',
+        '1.jpg',
+        '2.jpg',
+        '3.jpg',
+    )
+
+    @classmethod
+    def _qualityRank(cls, url):
+        for i, quality in enumerate(cls.quality_order):
+            if quality in url:
+                return i
+        return len(cls.quality_order) + 1
 
     @classmethod
     async def _run(cls, id, session: FytSession):
@@ -296,43 +358,44 @@ class ArchiveOrgCDX(Service):
             f"https://web.archive.org/cdx/search/cdx?url=img.youtube.com/vi/{id}*&collapse=digest&filter=statuscode:200&mimetype:image/jpeg&output=json",
         ]
 
-        results = []
-        for cdx in cdx_urls:
-            async with session.get(cdx, timeout=12) as resp:
-                metadata = await resp.json()
-            for result in metadata:
-                if result[0] != 'urlkey':
-                    results.append(result)
-
-        # sort and select the most recent of highest quality version available
-        results.sort(key=lambda x: x[1], reverse=True)
-        quality_order = [
-            'maxresdefault.jpg',
-            'sddefault.jpg',
-            'hqdefault.jpg',
-            '0.jpg',
-            'high.jpg',
-            'mqdefault.jpg',
-            'medium.jpg',
-            'default.jpg',
-            '1.jpg',
-            '2.jpg',
-            '3.jpg',
-        ]
-        def get_int(url):
-            for i in range(len(quality_order)):
-                if quality_order[i] in url:
-                    return i
-
-            return len(quality_order) + 1
-        results.sort(key=lambda x: get_int(x[2]))
+        serviceConfig = config.method(cls.configId)
+        # Per lookup; the total across lookups is limited by the web.archive.org connection pool
+        semaphore = asyncio.Semaphore(serviceConfig.get("concurrency", 4))
+        stopAtMaxres = serviceConfig.get("stop_at_maxres", False)
+
+        async def query(index, cdx):
+            async with semaphore:
+                async with session.get(cdx, timeout=12) as resp:
+                    return index, await resp.json()
+
+        # Select the most recent of the highest quality version available, as the results come in.
+        # Ties go to the earlier URL in the list, then the earlier row, like the stable sort this replaced.
+        best = None
+        bestKey = None
+        tasks = [asyncio.create_task(query(index, cdx)) for index, cdx in enumerate(cdx_urls)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                index, metadata = await task
+                for row, result in enumerate(metadata):
+                    if result[0] == 'urlkey':
+                        continue
+                    key = (cls._qualityRank(result[2]), -int(result[1]), index, row)
+                    if bestKey is None or key < bestKey:
+                        best, bestKey = result, key
+                if stopAtMaxres and bestKey is not None and bestKey[0] == 0:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Don't leave exceptions from the other queries unretrieved
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         archived = False
         # Limit to one result
         # TODO: maybe add a note about this?
-        for result in results[:1]:
+        if best is not None:
             yield Link(
-                url = f"https://web.archive.org/web/{result[1]}/{result[2]}",
+                url = f"https://web.archive.org/web/{best[1]}/{best[2]}",
                 contains = LinkContains(thumbnail = True),
                 title = "Thumbnail",
             )
@@ -347,8 +410,8 @@ class ArchiveOrgCDX(Service):
 
 @registry.misc
 class GhostArchive(Service):
-    name = methods["ghostarchive"]["title"]
     configId = "ghostarchive"
+    hosts = ("ghostarchive.org",)
 
     @classmethod
     async def _run(cls, id, session: FytSession):
@@ -381,18 +444,19 @@ class GhostArchive(Service):
 
 @registry.on_request
 class HackintYa(Service):
-    name = methods["hackint_ya"]["title"]
     note = ("Video retrieval is currently not available for technical reasons. "
             "Check back later for access instructions. This may take weeks or months."
             )
     configId = "hackint_ya"
+    hosts = ("ya.borg.xyz",)
 
     @classmethod
     async def _run(cls, id, session: FytSession):
-        username: str = methods[cls.configId]["username"]
-        password: str = methods[cls.configId]["password"]
-        excluded: list[str] = methods[cls.configId].get("excluded", [])
+        username: str = config.method(cls.configId)["username"]
+        password: str = config.method(cls.configId)["password"]
+        excluded: list[str] = config.method(cls.configId).get("excluded", [])
 
+        import aiohttp
         vid = id
         auth = aiohttp.BasicAuth(username, password)
         comments = False
@@ -419,8 +483,8 @@ class HackintYa(Service):
 
 @registry.on_request
 class DistributedYoutubeArchive(Service):
-    name = methods['distributed_youtube_archive']['title']
     configId = "distributed_youtube_archive"
+    hosts = ("dya-t-api.strangled.net",)
 
     @classmethod
     async def _run(cls, id, session: FytSession):
@@ -460,20 +524,17 @@ class DistributedYoutubeArchive(Service):
 
 @registry.public_archives
 class Hobune(Service):
-    name = methods["hobune_stream"]["title"]
     configId = "hobune_stream"
-    lastretrieved = 0
-    cooldown = 0.5
+    hosts = ("hobune.stream",)
+    # Used to be one lookup (2-4 requests) every half a second
+    ratelimit = {"rate": 4, "burst": 4}
 
     @classmethod
     async def _run(cls, id, session: FytSession):
-        while time.time() - cls.lastretrieved < cls.cooldown:
-            await asyncio.sleep(0.1)
         urls_to_try = ("https://hobune.stream/videos/{}", "https://hobune.stream/tpa-h/videos/{}")
         raw = []
         archived = False
         lastupdated = time.time()
-        cls.lastretrieved = lastupdated
 
         comments = False
 
@@ -509,36 +570,36 @@ class Hobune(Service):
 
 @registry.public_archives
 class removededm(Service):
-    name = methods["removededm"]["title"]
     configId = "removededm"
+    hosts = ("removededm.com",)
     endpoint = "https://removededm.com/w/api.php"
+    potential_image_extensions = ("jpg", "png", "webp")
+    # MediaWiki allows 50 titles per query, and each video needs 9
+    batch_max_size = 50 // 9
 
     @classmethod
-    async def _run(cls, id, session: FytSession):
-        got_video = False
-        got_page = False
-        potential_image_extensions = ("jpg", "png", "webp")
-        potential_files = (
+    def _potentialFiles(cls, id):
+        return (
             ([f"{id}"], dict(contains = LinkContains(metadata = True), title = "Metadata")),
             ([f"File:{id}.mp4", f"File:{id}.webm"], dict(contains = LinkContains(video = True), title = "Video")),
-            ([f"File:{id}.{ext}" for ext in potential_image_extensions], dict(
+            ([f"File:{id}.{ext}" for ext in cls.potential_image_extensions], dict(
                 contains = LinkContains(thumbnail = True),
                 title = "Thumbnail"
             )),
-            ([f"File:{id}_.{ext}" for ext in potential_image_extensions], dict(
+            ([f"File:{id}_.{ext}" for ext in cls.potential_image_extensions], dict(
                 contains = LinkContains(single_frame = True),
                 title = "Frame",
                 note = "This is a single frame of the video."
             )),
         )
-        archived = False
-        rawraw = None
-        link = f"https://removededm.com/{id}"
 
+    @classmethod
+    async def _fetchBatch(cls, ids: list[str], session: FytSession) -> dict:
+        titles = {id: [file for files, _ in cls._potentialFiles(id) for file in files] for id in ids}
         api_request = {
             "action": "query",
             "format": "json",
-            "titles": "|".join("|".join(i) for i, _ in potential_files),
+            "titles": "|".join("|".join(i) for i in titles.values()),
             "formatversion": "2",
         }
         async with session.get(cls.endpoint, params = api_request) as response:
@@ -550,6 +611,29 @@ class removededm(Service):
             if "error" in j:
                 raise RuntimeError("API error")
 
+        # Split the result back up, so each video only sees its own titles
+        results = {}
+        for id, videoTitles in titles.items():
+            videoTitles = set(videoTitles)
+            normalized = [i for i in j['query'].get('normalized', []) if i['from'] in videoTitles]
+            videoTitles.update(i['to'] for i in normalized)
+            results[id] = {"query": {
+                "pages": [page for page in j['query']['pages'] if page['title'] in videoTitles],
+                "normalized": normalized,
+            }}
+        return results
+
+    @classmethod
+    async def _run(cls, id, session: FytSession):
+        got_video = False
+        got_page = False
+        potential_files = cls._potentialFiles(id)
+        archived = False
+        rawraw = None
+        link = f"https://removededm.com/{id}"
+
+        j = await session.get_batcher(cls).submit(id)
+
         pages = set(page['title'] for page in j['query']['pages'] if not page.get("missing"))
         # MediaWiki will normalize IDs with underscores, like _kVU4fHJ9JM m_yqgZV6G5c
         for normalized_page in j['query']['normalized']:
@@ -585,6 +669,8 @@ class removededm(Service):
                         j = await response.json()
                 if "error" in j:
                     raise RuntimeError("API error 2")
+            # Only this service needs it, and it's slow to import
+            import wikitextparser
             wikitext = j['parse']['wikitext']
             parsed = wikitextparser.parse(wikitext)
             for template in parsed.templates:
@@ -607,8 +693,8 @@ class removededm(Service):
     async def login(cls, session: FytSession):
         # Need to set up proper debug logging.
         print("Logging into removededm", flush = True)
-        username = methods[cls.configId]['username']
-        password = methods[cls.configId]['password']
+        username = config.method(cls.configId)['username']
+        password = config.method(cls.configId)['password']
         # Get a lockso we don't log in multiple times at once
         async with session.get_lock(cls):
             # What's wrong with just including an API key in every request? :(
@@ -639,21 +725,35 @@ class removededm(Service):
 
 @registry.metadata
 class Filmot(Service):
-    name = methods["filmot"]["title"]
-    lastretrieved: int = 0
-    cooldown: int = 2
     configId = "filmot"
+    hosts = ("filmot.com",)
+    # One request every 2 seconds
+    ratelimit = {"rate": 0.5, "burst": 1}
 
     @classmethod
-    async def _run(cls, id, session: FytSession):
-        key = methods[cls.configId]["api_key"]
+    async def _batchGate(cls, session: FytSession):
+        # Wait for the rate limit before taking a batch, so the lookups that come in meanwhile are sent together
+        await session.ratelimiter.acquire("filmot.com")
 
-        while time.time() - cls.lastretrieved < cls.cooldown:
-            await asyncio.sleep(0.1)
-        lastupdated = time.time()
-        cls.lastretrieved = int(time.time())
-        async with session.get(f"https://filmot.com/api/getvideos?key={key}&id={id}&flags=1") as resp:
+    @classmethod
+    async def _fetchBatch(cls, ids: list[str], session: FytSession) -> dict:
+        key = config.method(cls.configId)["api_key"]
+        async with session.get(
+            "https://filmot.com/api/getvideos", params={"key": key, "id": ",".join(ids), "flags": 1}, ratelimit=False
+        ) as resp:
             metadata = await resp.json(content_type=None)
+        if not isinstance(metadata, list):
+            raise RuntimeError(f"Unexpected response from Filmot: {metadata!r}")
+        results = {id: [] for id in ids}
+        for video in metadata:
+            if video.get("id") in results:
+                results[video["id"]].append(video)
+        return results
+
+    @classmethod
+    async def _run(cls, id, session: FytSession):
+        metadata = await session.get_batcher(cls).submit(id)
+        lastupdated = time.time()
         rawraw = metadata
         if len(metadata) > 0: # pylint: disable=simplifiable-if-statement
             archived = True
@@ -676,15 +776,14 @@ class Playboard(Service):
     """
     Playboard is metadata-only as far as I know.
     """
-    name = methods["playboard_co"]["title"]
     note = "The Playboard scraper is unreliable; please verify values yourself."
     configId = "playboard_co"
-    user_agent = methods["playboard_co"]["user_agent"]
+    hosts = ("playboard.co",)
 
     @classmethod
     async def _run(cls, id, session: FytSession):
         note = cls.note
-        user_agent = cls.user_agent % random.randint(0, 100)
+        user_agent = config.method(cls.configId)["user_agent"] % random.randint(0, 100)
         url = f"https://playboard.co/en/video/{id}"
         async with session.get(url, headers={"User-Agent": user_agent}) as resp:
             code = resp.status
@@ -716,9 +815,9 @@ class AltCensored(Service):
     """
     altCensored does not store any videos. Instead, it links to archived versions.
     """
-    name = methods["altcensored"]["title"]
     note = ""
     configId = "altcensored"
+    hosts = ("altcensored.com",)
 
     @classmethod
     async def _run(cls, id, session: FytSession):
@@ -748,13 +847,13 @@ class Odysee(Service):
     """
     Queries the LBRY YouTube Sync API to find out whether the video has been mirrored to Odysee.
     """
-    name = methods['odysee']['title']
     configId = "odysee"
+    hosts = ("api.lbry.com",)
 
     @classmethod
-    async def _run(cls, id, session: FytSession):
-        lastupdated = time.time()
-        async with session.get(f"https://api.lbry.com/yt/resolve?video_ids={id}") as resp:
+    async def _fetchBatch(cls, ids: list[str], session: FytSession) -> dict:
+        # The endpoint takes a comma-separated list of IDs and returns a map of all of them
+        async with session.get("https://api.lbry.com/yt/resolve", params={"video_ids": ",".join(ids)}) as resp:
             status = resp.status
             if status != 200:
                 raise RuntimeError(f"LBRY API returned bad status code {status}")
@@ -765,6 +864,17 @@ class Odysee(Service):
             raise ValueError("No \"data\" field in response!")
         if "videos" not in j["data"]:
             raise ValueError("No \"videos\" field in response!")
+        # Give each video a copy of the response that only has its own ID in it
+        videos = j["data"]["videos"]
+        return {
+            id: j | {"data": j["data"] | {"videos": {id: videos[id]} if id in videos else {}}}
+            for id in ids
+        }
+
+    @classmethod
+    async def _run(cls, id, session: FytSession):
+        lastupdated = time.time()
+        j = await session.get_batcher(cls).submit(id)
         if id not in j["data"]["videos"]:
             raise ValueError("No video ID field in response!")
         odyseeId = j["data"]["videos"][id]
@@ -786,9 +896,9 @@ class Odysee(Service):
 
 @registry.public_archives
 class PreserveTube(Service):
-    name = methods["preservetube"]["title"]
     note = ""
     configId = "preservetube"
+    hosts = ("api.preservetube.com",)
 
     @classmethod
     async def _run(cls, id, session: FytSession):
@@ -836,9 +946,9 @@ class PreserveTube(Service):
 
 @registry.public_archives
 class NyaneOnline(Service):
-    name = methods['nyaneonline']['title']
     note = ""
     configId = "nyaneonline"
+    hosts = ("www.nyane.online",)
 
     @classmethod
     async def _run(cls, id, session: FytSession):
@@ -867,9 +977,9 @@ class NyaneOnline(Service):
 
 @registry.metadata
 class LetsPlayIndex(Service):
-    name = methods['letsplayindex']['title']
     note = ""
     configId = "letsplayindex"
+    hosts = ("www.letsplayindex.com",)
 
     @classmethod
     async def _run(cls, id, session: FytSession):
@@ -0,0 +1,59 @@
+"""
+Coalescing of concurrent lookups, so that simultaneous requests for the same video share one run of each service.
+"""
+import asyncio
+
+class Flight:
+    """
+    An in-flight run of a service. Any number of subscribers can follow it; each gets every item in order,
+    including the ones emitted before it subscribed.
+    The run continues in its own task, so it isn't affected by a subscriber going away.
+    """
+    def __init__(self, gen):
+        """
+        Arguments:
+            gen (AsyncGenerator): The generator to run. It is started immediately.
+        """
+        self.items = []
+        self.done = False
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task = asyncio.create_task(self._run(gen))
+
+    async def _run(self, gen):
+        try:
+            async for item in gen:
+                self.items.append(item)
+                async with self.changed:
+                    self.changed.notify_all()
+        finally:
+            self.done = True
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def subscribe(self):
+        """
+        Yields every item the run emits, starting from the first one.
+        """
+        index = 0
+        self.subscribers += 1
+        try:
+            while True:
+                while index < len(self.items):
+                    yield self.items[index]
+                    index += 1
+                if self.done:
+                    return
+                async with self.changed:
+                    await self.changed.wait_for(lambda: index < len(self.items) or self.done)
+        finally:
+            self.subscribers -= 1
+
+    def cancel_if_unused(self) -> bool:
+        """
+        Stops the run if nobody is following it any more. Returns whether it was stopped.
+        """
+        if not self.done and self.subscribers == 0:
+            self.task.cancel()
+            return True
+        return False
@@ -0,0 +1,108 @@
+"""
+Tracking of how long each service's requests take, used for adaptive timeouts and hedged requests, and of
+how often the service finds videos, used to decide which services to start first in first-hit mode.
+"""
+import collections
+import math
+
+import typing_extensions as typing
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    # How many recent requests are remembered per service
+    "window": 200,
+    # Nothing is adapted until this many requests have been seen
+    "min_samples": 20,
+    "timeout_percentile": 99,
+    "timeout_margin": 1.0,
+    "timeout_floor": 2.0,
+    "timeout_ceiling": 20.0,
+    "hedge": False,
+    "hedge_percentile": 95,
+}
+
+class LatencyTracker:
+    """
+    A rolling window of request durations for one service, plus counters.
+    """
+    def __init__(self, settings: dict):
+        """
+        Arguments:
+            settings (dict): DEFAULT_SETTINGS, with any changes from config.yml applied.
+        """
+        self.settings = settings
+        self.samples: collections.deque[float] = collections.deque(maxlen=settings["window"])
+        self._sorted: typing.Optional[list[float]] = None
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.runs = 0
+        self.hits = 0
+
+    def record_run(self, hit: bool):
+        """
+        Records the result of a whole run of the service: whether it found the video.
+        """
+        self.runs += 1
+        self.hits += hit
+
+    def score(self) -> float:
+        """
+        Roughly how likely the service is to find a video, per second it takes.
+        Services without much history get the benefit of the doubt.
+        """
+        hitRate = (self.hits + 1) / (self.runs + 2)
+        p50 = self.percentile(50)
+        return hitRate / max(p50 if p50 is not None else 0.5, 0.05)
+
+    def record(self, duration: float):
+        self.samples.append(duration)
+        self._sorted = None
+
+    def percentile(self, p: float) -> typing.Optional[float]:
+        """
+        Returns the p-th percentile of the recent durations, or None if there aren't enough of them yet.
+        """
+        if len(self.samples) < self.settings["min_samples"]:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        index = min(len(self._sorted) - 1, math.ceil(p / 100 * len(self._sorted)) - 1)
+        return self._sorted[max(0, index)]
+
+    def timeout(self, explicit: typing.Optional[float] = None) -> float:
+        """
+        Returns the timeout for the next request: the configured percentile plus a margin, but never more than
+        the ceiling or the timeout the service asked for.
+        """
+        ceiling = self.settings["timeout_ceiling"]
+        if explicit is not None:
+            ceiling = min(ceiling, explicit)
+        if not self.settings["enabled"]:
+            return ceiling
+        p = self.percentile(self.settings["timeout_percentile"])
+        if p is None:
+            return ceiling
+        return min(ceiling, max(self.settings["timeout_floor"], p + self.settings["timeout_margin"]))
+
+    def hedge_after(self) -> typing.Optional[float]:
+        """
+        Returns how long to wait before sending a second copy of a request, or None to not hedge.
+        """
+        if not (self.settings["enabled"] and self.settings["hedge"]):
+            return None
+        return self.percentile(self.settings["hedge_percentile"])
+
+    def stats(self) -> dict:
+        return {
+            "samples": len(self.samples),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "timeout": self.timeout(),
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "runs": self.runs,
+            "hits": self.hits,
+        }
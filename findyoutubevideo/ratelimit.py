@@ -0,0 +1,140 @@
+"""
+Rate limiting of requests to upstream hosts, using a token bucket per host.
+"""
+import asyncio
+import collections
+import time
+
+import typing_extensions as typing
+
+class TokenBucket:
+    """
+    A token bucket. Waiters get tokens in the order they asked for them, and are woken by a timer when the
+    next token is due, so nothing polls.
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Arguments:
+            rate (float): How many tokens are added per second.
+            burst (int): The most tokens that can be saved up, i.e. how many requests can be sent at once after a quiet period.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.waiters: collections.deque[asyncio.Future] = collections.deque()
+        self.timer: typing.Optional[asyncio.TimerHandle] = None
+        self.acquired = 0
+        self.waited = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _schedule(self):
+        if self.timer is None:
+            delay = max(0, (1 - self.tokens) / self.rate)
+            self.timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self):
+        self.timer = None
+        self._refill()
+        while self.waiters and self.tokens >= 1:
+            future = self.waiters.popleft()
+            if future.done():
+                # Cancelled while waiting
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        # Skip over cancelled waiters, so the timer doesn't run for nothing
+        while self.waiters and self.waiters[0].done():
+            self.waiters.popleft()
+        if self.waiters:
+            self._schedule()
+
+    async def acquire(self):
+        """
+        Waits for a token and takes it.
+        """
+        self._refill()
+        if not self.waiters and self.tokens >= 1:
+            self.tokens -= 1
+            self.acquired += 1
+            return
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # We were given a token just as we were cancelled; pass it on
+                self._refill()
+                self.tokens = min(self.burst, self.tokens + 1)
+                if self.timer is not None:
+                    self.timer.cancel()
+                self._wake()
+            raise
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.waited += 1
+        self.wait_time += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "waiting": sum(not future.done() for future in self.waiters),
+            "wait_time": self.wait_time,
+            "max_wait": self.max_wait,
+        }
+
+class RateLimiter:
+    """
+    The token buckets for every rate-limited host. Requests to other hosts aren't limited.
+    """
+    def __init__(self):
+        self.buckets: dict[str, TokenBucket] = {}
+
+    @classmethod
+    def from_services(cls, services, methods: dict[str, dict]) -> 'RateLimiter':
+        """
+        Creates buckets for the `hosts` of every service that has a rate limit.
+        The limit is the service's `ratelimit` setting in config.yml, or its `ratelimit` attribute if that isn't set.
+        """
+        self = cls()
+        for service in services:
+            settings = methods.get(service.configId, {}).get("ratelimit", service.ratelimit)
+            if not settings:
+                continue
+            for host in service.hosts:
+                self.configure(host, settings["rate"], settings.get("burst", 1))
+        return self
+
+    def configure(self, host: str, rate: float, burst: int = 1):
+        """
+        Sets the limit for a host. If several services talk to the same host, the strictest limit is used.
+        """
+        existing = self.buckets.get(host)
+        if existing is None or rate < existing.rate:
+            self.buckets[host] = TokenBucket(rate, burst)
+
+    async def acquire(self, host: str):
+        """
+        Waits until a request can be sent to `host`.
+        """
+        bucket = self.buckets.get(host)
+        if bucket is not None:
+            await bucket.acquire()
+
+    def stats(self) -> dict:
+        return {host: bucket.stats() for host, bucket in self.buckets.items()}
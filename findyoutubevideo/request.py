@@ -0,0 +1,118 @@
+"""
+The requests returned by FytSession's `get`, `head` and `post`.
+"""
+import asyncio
+import time
+
+import typing_extensions as typing
+
+from .latency import LatencyTracker
+from .ratelimit import TokenBucket
+
+class ManagedRequest:
+    """
+    A request that waits for its host's rate limit, records how long it took, and can be hedged: if the
+    first copy is slow, an identical second one is sent, and whichever answers first is used.
+    Like an aiohttp request, it can be awaited or used with `async with`.
+    """
+    __slots__ = ("send", "bucket", "tracker", "hedge", "start", "response")
+
+    def __init__(
+        self, send: typing.Callable, bucket: typing.Optional[TokenBucket] = None,
+        tracker: typing.Optional[LatencyTracker] = None, hedge: bool = False
+    ):
+        """
+        Arguments:
+            send (Callable): Starts the actual request, e.g. `lambda: session.get(url)`.
+            bucket (TokenBucket): The rate limit to wait for, if any.
+            tracker (LatencyTracker): Where to record how long the request took, if anywhere.
+            hedge (bool): Whether the request may be sent twice. Only use this for requests that are safe to repeat.
+        """
+        self.send = send
+        self.bucket = bucket
+        self.tracker = tracker
+        self.hedge = hedge
+        self.start = None
+        self.response = None
+
+    async def _attempt(self):
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        if self.start is None:
+            # Time spent waiting for the rate limit doesn't count
+            self.start = time.monotonic()
+        return await self.send()
+
+    async def _hedged(self, delay: float):
+        first = asyncio.create_task(self._attempt())
+        second = None
+        winner = None
+        try:
+            done, _ = await asyncio.wait((first,), timeout=delay)
+            if done:
+                winner = first
+            else:
+                self.tracker.hedges += 1
+                second = asyncio.create_task(self._attempt())
+                pending = {first, second}
+                while pending and winner is None:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in (first, second):
+                        if task in done and task.exception() is None:
+                            winner = task
+                            break
+                if winner is second:
+                    self.tracker.hedge_wins += 1
+            # If both copies failed, raise the first one's error
+            return (winner or first).result()
+        finally:
+            for task in (first, second):
+                if task is None or task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    # Both copies answered at once
+                    task.result().release()
+
+    async def _send(self):
+        delay = self.tracker.hedge_after() if self.hedge and self.tracker is not None else None
+        try:
+            if delay is None:
+                return await self._attempt()
+            return await self._hedged(delay)
+        except asyncio.TimeoutError:
+            self._timedOut()
+            raise
+
+    def _timedOut(self):
+        if self.tracker is not None:
+            self.tracker.timeouts += 1
+        # The request took at least this long. Recording it lets the timeout grow if the service slows down;
+        # otherwise only requests that beat the current timeout would be remembered, and it could never go up.
+        self._record()
+
+    def _record(self):
+        if self.tracker is not None and self.start is not None:
+            self.tracker.record(time.monotonic() - self.start)
+
+    async def _awaited(self):
+        response = await self._send()
+        self._record()
+        return response
+
+    def __await__(self):
+        return self._awaited().__await__()
+
+    async def __aenter__(self):
+        self.response = await self._send()
+        return await self.response.__aenter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, asyncio.TimeoutError):
+            # Timed out while reading the body
+            self._timedOut()
+        elif exc_type is None or not issubclass(exc_type, asyncio.CancelledError):
+            # A cancelled request says nothing about how long it would have taken
+            self._record()
+        return await self.response.__aexit__(exc_type, exc, tb)
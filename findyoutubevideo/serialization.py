@@ -0,0 +1,100 @@
+"""
+Serializes responses to JSON bytes.
+The encoded form of each Service, Link and verdict is remembered per API version, so a result that is
+served many times (because it was cached or coalesced) is only converted and encoded once.
+"""
+import json
+
+from .types import (
+    API_VERSION, BaseService, Link, Response, StreamResponse,
+    TargetAPIVersionTooHighError, TargetAPIVersionTooLowError
+)
+
+# Verdicts and lists of service names only have a few possible values, so they are remembered by value.
+_plainCache: dict[tuple, bytes] = {}
+
+def encode_service(service: BaseService, version: int = API_VERSION) -> bytes:
+    """
+    Returns the JSON for a (v5) Service, converted to the given API version.
+    """
+    memo = service.__dict__.setdefault("_json", {})
+    encoded = memo.get(version)
+    if encoded is None:
+        encoded = memo[version] = service._downgrade(API_VERSION, version).json_bytes()
+    return encoded
+
+def encode_link(link: Link) -> bytes:
+    """
+    Returns the JSON for a Link. Links only exist in API v5 and up.
+    """
+    encoded = link._json
+    if encoded is None:
+        encoded = link._json = link.json_bytes()
+    return encoded
+
+def encode_plain(obj) -> bytes:
+    """
+    Returns the JSON for a verdict, a list of service names, or None.
+    """
+    if obj is None:
+        return b"null"
+    key = tuple(obj.items())
+    encoded = _plainCache.get(key)
+    if encoded is None:
+        if len(_plainCache) > 1024:
+            _plainCache.clear()
+        encoded = _plainCache[key] = json.dumps(obj).encode()
+    return encoded
+
+def encode_item(item, version: int = API_VERSION) -> bytes:
+    """
+    Returns the JSON for anything sent in a stream.
+    """
+    if isinstance(item, BaseService):
+        return encode_service(item, version)
+    if isinstance(item, Link):
+        return encode_link(item)
+    return encode_plain(item)
+
+def encode_tagged(id: str, item, version: int = API_VERSION) -> bytes:
+    """
+    Returns the JSON for an item of a stream, wrapped as `{"id": id, "data": item}` so that the items of
+    several streams can be sent down one connection.
+    """
+    return b'{"id": ' + json.dumps(id).encode() + b', "data": ' + encode_item(item, version) + b"}"
+
+def encode_response(response: Response, version: int = API_VERSION) -> bytes:
+    """
+    Returns the same thing as `response.coerce_to_api_version(version).json()`, as bytes.
+    """
+    if version > response.api_version:
+        raise TargetAPIVersionTooHighError("cannot upgrade api version")
+    if version < response.min_api_version:
+        raise TargetAPIVersionTooLowError("cannot downgrade any further")
+    keys = b", ".join(encode_service(service, version) for service in response.keys)
+    return b"".join((
+        b'{"_type": "', type(response).__module__.encode(), b".", type(response).__name__.encode(),
+        b'", "id": ', json.dumps(response.id).encode(),
+        b', "status": ', json.dumps(response.status).encode(),
+        b', "keys": [', keys,
+        b'], "verdict": ', encode_plain(response.verdict),
+        b', "api_version": ', str(version).encode(), b"}",
+    ))
+
+async def encode_stream(stream: StreamResponse, version: int = API_VERSION):
+    """
+    Yields the JSON lines (including the newline) for a streamed response, converted to the given API version.
+    This does the same thing as `coerce_to_api_version`, but yields bytes.
+    """
+    if version > stream.api_version:
+        raise TargetAPIVersionTooHighError(version)
+    if version < 4:
+        raise TargetAPIVersionTooLowError(version)
+    yield encode_plain(await anext(stream)) + b"\n"
+    async for item in stream:
+        if version == 4 and isinstance(item, Link):
+            continue
+        yield encode_item(item, version) + b"\n"
+        if item is None:
+            break
+    yield encode_plain(await anext(stream)) + b"\n"
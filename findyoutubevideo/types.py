@@ -1,27 +1,65 @@
 """
 The classes that are used to store the response data.
 """
+import contextvars
 import copy
 import dataclasses
 import enum
+import math
 import time
 import typing_extensions as typing
 import re
 import traceback
+import urllib.parse
 
 import asyncio
-import aiohttp
-import yaml
 
-from snscrape.base import _JSONDataclass as JSONDataclass
+from . import encoder
+from .batching import Batcher
+from .breaker import DEFAULT_SETTINGS as DEFAULT_BREAKER_SETTINGS, CircuitBreaker
+from .cache import ResultCache
+from .config import config
+from .flight import Flight
+from .latency import DEFAULT_SETTINGS as DEFAULT_LATENCY_SETTINGS, LatencyTracker
+from .ratelimit import RateLimiter
+from .request import ManagedRequest
+
+if typing.TYPE_CHECKING:
+    # Only imported when it is needed, so importing the package stays fast
+    import aiohttp
+
+def __getattr__(name):
+    # These used to be read from config.yml when the module was imported.
+    # Keep them working for existing code, but only load the config when they are used.
+    if name == "config_yml":
+        return config.data
+    if name in ("methods", "user_agent", "experiment_base_url"):
+        return getattr(config, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# The Service whose code is running, so that requests can be attributed to it
+current_service: contextvars.ContextVar[typing.Optional[type['BaseService']]] = contextvars.ContextVar("current_service", default=None)
+
+# Markers put on _generateStream's queue: a service has finished, or the deadline has passed
+_FINISHED = object()
+_EXPIRED = object()
+
+class JSONDataclass:
+    """
+    A base class for dataclasses that can be converted to JSON.
+    """
+    __slots__ = ()
+    def json(self) -> str:
+        """
+        Converts the object to a JSON string. See `encoder.py`.
+        """
+        return encoder.dumps(self).decode()
 
-with open('config.yml', 'r') as file:
-    config_yml = yaml.safe_load(file)
-    methods = config_yml["methods"]
-    user_agent = config_yml.get("user_agent") # defaults to None if not set
-    experiment_base_url = config_yml.get("experiment_base_url")
-    if experiment_base_url:
-        experiment_base_url = experiment_base_url.rstrip("/")
+    def json_bytes(self) -> bytes:
+        """
+        Converts the object to JSON, as bytes.
+        """
+        return encoder.dumps(self)
 
 def create_verdict(archived: dict):
     verdict = ""
@@ -36,38 +74,203 @@ def create_verdict(archived: dict):
     return verdict
 
 class FytSession:
-    session: aiohttp.ClientSession
+    session: "aiohttp.ClientSession"
     locks: dict[type['BaseService'], asyncio.Lock]
+    ratelimiter: RateLimiter
+    latency: dict[type['BaseService'], LatencyTracker]
+    breakers: dict[type['BaseService'], CircuitBreaker]
+    cache: typing.Optional[ResultCache]
+    flights: dict[tuple[type['BaseService'], str], Flight]
+    batchSlots: asyncio.Semaphore
 
     @classmethod
     def _get_services(cls) -> list[type['BaseService']]:
         potentialServices = registry.get_services()
         return [service for service in potentialServices if service.enabled()]
 
+    @classmethod
+    def select_services(cls, include: typing.Optional[typing.Iterable] = None,
+                        exclude: typing.Optional[typing.Iterable] = None) -> list[type['BaseService']]:
+        """
+        Returns the enabled services, narrowed down by `include` and `exclude`.
+        Arguments:
+            include (Optional[Iterable]): If given, only services that match one of these are used.
+            exclude (Optional[Iterable]): Services that match one of these aren't used, even if they are included.
+        Each item can be a service class, a ServiceCategory, or a string: a class name (e.g. "GhostArchive"),
+        a config ID (e.g. "ghostarchive") or a category name (e.g. "IA"). Strings are not case-sensitive.
+        Raises UnknownServiceError if a string doesn't match anything, and NoServicesSelectedError if
+        `include` or `exclude` leaves no services to run (the verdict would otherwise always be "not found").
+        """
+        services = cls._get_services()
+        if include is not None:
+            include = registry.match(include)
+            services = [service for service in services if service in include]
+        if exclude is not None:
+            exclude = registry.match(exclude)
+            services = [service for service in services if service not in exclude]
+        if not services and (include is not None or exclude is not None):
+            raise NoServicesSelectedError("No enabled services were selected")
+        return services
+
     @classmethod
     async def new(cls, batching = False):
+        """
+        Arguments:
+            batching (bool): Whether to combine concurrent lookups into one request, for services that support it.
+                This only helps when many videos are looked up at the same time, and adds a short delay.
+        """
+        import aiohttp
         self = cls()
+        self.batching = batching
+        self.batchers = {}
+        encoder.set_backend(config.get("json_backend", "json"))
         headers = {}
-        if user_agent:
-            headers["User-Agent"] = user_agent
-        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=20), headers=headers)
+        if config.user_agent:
+            headers["User-Agent"] = config.user_agent
+        connections = config.get("connections") or {}
+        hostSettings = connections.get("hosts") or {}
+
+        def makeSession(host=None):
+            settings = connections | (hostSettings.get(host) or {})
+            connector = aiohttp.TCPConnector(
+                limit=settings.get("limit", 100),
+                limit_per_host=settings.get("limit_per_host", 0),
+                keepalive_timeout=settings.get("keepalive_timeout", 15),
+                ttl_dns_cache=settings.get("ttl_dns_cache", 10),
+            )
+            return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=20), headers=headers)
+
+        # Hosts with their own settings get their own pool; everything else shares the default one
+        self.session = makeSession()
+        self.sessions = {host: makeSession(host) for host in hostSettings}
         self.locks = {}
+        self.ratelimiter = RateLimiter.from_services(cls._get_services(), config.methods)
+        self.latency = {}
+        self.breakers = {}
+        self.cache = ResultCache.from_config(config.get("cache") or {}, config.methods)
+        self.flights = {}
+        self.coalesced = 0
+        self.revalidations = 0
+        # Shared by every generateBatch call, so that concurrent batches can't multiply the load
+        self.batchSlots = asyncio.Semaphore((config.get("batch") or {}).get("concurrency", 8))
         return self
 
-    def head(self, *args, **kwargs):
-        return self.session.head(*args, **kwargs)
+    def _request(self, method: str, url, *args, ratelimit=True, **kwargs):
+        host = urllib.parse.urlsplit(str(url)).hostname
+        send = getattr(self.sessions.get(host, self.session), method)
+        bucket = self.ratelimiter.buckets.get(host) if ratelimit else None
+        service = current_service.get()
+        tracker = self.get_latency(service) if service is not None and method != "post" else None
+        if tracker is None:
+            if bucket is None:
+                return send(url, *args, **kwargs)
+            return ManagedRequest(lambda: send(url, *args, **kwargs), bucket)
+        import aiohttp
+        # The timeout the service asked for is the most it gets
+        explicit = kwargs.pop("timeout", None)
+        explicit = getattr(explicit, "total", explicit)
+        kwargs["timeout"] = aiohttp.ClientTimeout(total=tracker.timeout(explicit))
+        # A second copy would be an extra request to a rate-limited host
+        hedge = ratelimit and host not in self.ratelimiter.buckets
+        return ManagedRequest(lambda: send(url, *args, **kwargs), bucket, tracker, hedge=hedge)
+
+    # These take the same arguments as the aiohttp methods, plus `ratelimit`.
+    # If the host is rate-limited, the request waits for its turn, unless `ratelimit` is False
+    # (for callers that already took a token themselves).
+    # GET and HEAD requests made by a service get an adaptive timeout, and can be hedged (see `latency` in config.yml),
+    # except to rate-limited hosts.
+
+    def head(self, url, *args, **kwargs):
+        return self._request("head", url, *args, **kwargs)
+
+    def get(self, url, *args, **kwargs):
+        return self._request("get", url, *args, **kwargs)
+
+    def post(self, url, *args, **kwargs):
+        return self._request("post", url, *args, **kwargs)
+
+    async def prewarm(self, timeout: float = 5):
+        """
+        Opens a connection to every host used by the enabled services, so that the first lookup doesn't have to
+        wait for DNS and TLS handshakes. Sends one HEAD request to the root of each host; errors are ignored.
+        The connections are only kept for the pool's keepalive_timeout.
+        """
+        import aiohttp
+        hosts = {host for service in self._get_services() for host in service.hosts}
+
+        async def warm(host):
+            try:
+                async with self.head(f"https://{host}/", timeout=timeout, ratelimit=False):
+                    pass
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
 
-    def get(self, *args, **kwargs):
-        return self.session.get(*args, **kwargs)
+        await asyncio.gather(*(warm(host) for host in hosts))
 
-    def post(self, *args, **kwargs):
-        return self.session.post(*args, **kwargs)
+    def get_latency(self, cls: type['BaseService']) -> LatencyTracker:
+        """
+        Returns the request latency tracker for a service. Its settings are the `latency` section of config.yml,
+        with any changes from the service's own `latency` setting.
+        """
+        if cls not in self.latency:
+            settings = DEFAULT_LATENCY_SETTINGS | (config.get("latency") or {}) | (config.method(cls.configId).get("latency") or {})
+            self.latency[cls] = LatencyTracker(settings)
+        return self.latency[cls]
+
+    def get_breaker(self, cls: type['BaseService']) -> CircuitBreaker:
+        """
+        Returns the circuit breaker for a service. Its settings are the `circuit_breaker` section of config.yml,
+        with any changes from the service's own `circuit_breaker` setting.
+        """
+        if cls not in self.breakers:
+            settings = (
+                DEFAULT_BREAKER_SETTINGS
+                | (config.get("circuit_breaker") or {})
+                | (config.method(cls.configId).get("circuit_breaker") or {})
+            )
+            self.breakers[cls] = CircuitBreaker(settings)
+        return self.breakers[cls]
 
     def get_lock(self, cls):
         if cls not in self.locks:
             self.locks[cls] = asyncio.Lock()
         return self.locks[cls]
 
+    def get_batcher(self, cls: type['BaseService']) -> Batcher:
+        """
+        Returns the Batcher for a service that supports batching (see `BaseService._fetchBatch`).
+        The window and maximum size can be changed with `batch_window` and `batch_max_size` in the service's config.
+        """
+        if cls._fetchBatch is None:
+            raise NotImplementedError(f"{cls.__name__} does not support batching")
+        if cls not in self.batchers:
+            serviceConfig = config.method(cls.configId)
+            fetch = lambda ids : cls._fetchBatch(ids, self)
+            gate = (lambda : cls._batchGate(self)) if cls._batchGate is not None else None
+            if self.batching:
+                self.batchers[cls] = Batcher(
+                    fetch,
+                    window=serviceConfig.get("batch_window", cls.batch_window),
+                    max_size=serviceConfig.get("batch_max_size", cls.batch_max_size),
+                    gate=gate,
+                )
+            else:
+                self.batchers[cls] = Batcher(fetch, window=0, max_size=1, gate=gate)
+        return self.batchers[cls]
+
+    def metrics(self) -> dict:
+        """
+        Returns counters that are useful for monitoring, such as cache hits and misses.
+        """
+        return {
+            "cache": self.cache.stats() if self.cache else None,
+            "flights": {"in_flight": len(self.flights), "coalesced": self.coalesced, "revalidations": self.revalidations},
+            "batches": {cls.__name__: batcher.stats() for cls, batcher in self.batchers.items()},
+            "ratelimits": self.ratelimiter.stats(),
+            "latency": {cls.__name__: tracker.stats() for cls, tracker in self.latency.items()},
+            "breakers": {cls.__name__: breaker.stats() for cls, breaker in self.breakers.items()},
+        }
+
     async def close(self):
         """
         Closes the FytSession and frees all associated resources.
@@ -75,8 +278,14 @@ class FytSession:
         If there are still responses being generated, the effect is undefined.
         """
         await self.session.close()
-
-    async def _generateStream(self, id: str, includeRaw=False):
+        for session in self.sessions.values():
+            await session.close()
+        if self.cache:
+            # Waits for the queued writes to be stored
+            await asyncio.to_thread(self.cache.close)
+
+    async def _generateStream(self, id: str, includeRaw=False, staleWhileRevalidate=False, followUp=True,
+                              deadline: typing.Optional[float] = None, firstHit=False, include=None, exclude=None):
         """
         Runs all the Services but as a generator.
         First item is a list of all the service names.
@@ -86,66 +295,288 @@ class FytSession:
         Arguments:
             id (str): The video ID
             includeRaw (bool): Whether or not to include the raw data in the `rawraw` field. If you don't need it, disable this.
+            staleWhileRevalidate (bool): Whether to send expired cached results straight away, refreshing them in the background.
+            followUp (bool): In stale-while-revalidate mode, whether to wait for the refreshed results and send them too.
+                A service can then have more than one result; the last one is the most recent.
+            deadline (Optional[float]): How long to wait for the services, in seconds. Services that haven't sent a
+                result by then are stopped, and get an error result instead. The verdict then has a `partial` key,
+                which is True if that happened.
+            firstHit (bool): Stop as soon as a service finds the video (not just its metadata), cancelling the others.
+                The verdict then has a `partial` key, which is True if any services were cancelled. See `first_hit`
+                in config.yml for the order the services are started in.
+            include, exclude (Optional[Iterable]): Which services to run; see `select_services`. The names list and
+                the verdict only cover these services.
         """
         if not self.verifyId(id):
             raise InvalidVideoIdError(id)
-        keys = []
-        services = self._get_services()
-        coroutines = []
-        queue = asyncio.Queue(1)
-        done = asyncio.Event()
-
-        async def iterate(name, gen):
-            nonlocal taskCount
+        keys = {}
+        links = {}
+        services = self.select_services(include, exclude)
+        queue = asyncio.Queue()
+        expired = False
+        stopped = False
+        delays = {}
+        if firstHit:
+            firstHitConfig = config.get("first_hit") or {}
+            order = services
+            if firstHitConfig.get("order_by_history", True):
+                order = sorted(services, key=lambda service: self.get_latency(service).score(), reverse=True)
+            delays = {service.__name__: index * firstHitConfig.get("stagger", 0) for index, service in enumerate(order)}
+
+        async def iterate(service, gen):
+            name = service.__name__
+            links = []
+            finished = False
             try:
+                if delays.get(name):
+                    await asyncio.sleep(delays[name])
                 async for i in gen:
                     if isinstance(i, Link):
                         i.classname = name
-                    await queue.put(i)
+                        links.append(i)
+                    else:
+                        finished = True
+                    queue.put_nowait(i)
+            except Exception as ename: # pylint: disable=broad-except
+                # Something outside the service itself failed (e.g. the cache); don't let it vanish from the results
+                traceback.print_exc()
+                if not finished:
+                    queue.put_nowait(self._crashed(service, links, ename))
             finally:
-                taskCount -= 1
-                if taskCount <= 0:
-                    done.set()
+                queue.put_nowait(_FINISHED)
 
         svcs = {}
+        tasks = []
         for service in services:
             svcs[service.__name__] = service.getName()
-            coroutines.append((service.__name__, service.run(id, self, includeRaw=includeRaw)))
-        taskCount = len(svcs)
-        coroutines = [asyncio.create_task(iterate(name, coro)) for name, coro in coroutines]
+            gen = self._runService(service, id, includeRaw, staleWhileRevalidate, followUp)
+            tasks.append(asyncio.create_task(iterate(service, gen)))
+        # One timer for the whole lookup, rather than a timeout on every get
+        timer = None if deadline is None else asyncio.get_running_loop().call_later(deadline, queue.put_nowait, _EXPIRED)
         yield svcs
 
-        while not done.is_set() or not queue.empty():
-            done_task = asyncio.create_task(done.wait())
-            queue_task = asyncio.create_task(queue.get())
-            tasks = {done_task, queue_task}
-            done_tasks, tasks = await asyncio.wait(tasks, return_when = asyncio.FIRST_COMPLETED)
-            if queue_task in done_tasks:
-                retval = await queue_task
+        remaining = len(tasks)
+        try:
+            while remaining:
+                retval = await queue.get()
+                if retval is _FINISHED:
+                    remaining -= 1
+                    continue
+                if retval is _EXPIRED:
+                    expired = True
+                    break
                 yield retval
                 if isinstance(retval, Service):
-                    keys.append(retval)
-            else:
-                queue_task.cancel()
-            done_task.cancel()
-
-        done_tasks, pending = await asyncio.wait(coroutines, timeout = 0)
-        assert not pending
+                    # In stale-while-revalidate mode, a refreshed result replaces the stale one
+                    keys[retval.classname] = retval
+                    if firstHit and retval.archived and not retval.metaonly and retval.error is None:
+                        stopped = True
+                        break
+                elif deadline is not None:
+                    links.setdefault(retval.classname, []).append(retval)
+        except (asyncio.CancelledError, GeneratorExit):
+            # Nobody is listening any more, so stop the services too
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._cancelFlights(services, id, keys)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        if expired or stopped:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Anything that was sent just before the deadline still counts
+            while not queue.empty():
+                retval = queue.get_nowait()
+                if retval is _FINISHED or retval is _EXPIRED:
+                    continue
+                yield retval
+                if isinstance(retval, Service):
+                    keys[retval.classname] = retval
+                else:
+                    links.setdefault(retval.classname, []).append(retval)
+            self._cancelFlights(services, id, keys)
+            if expired:
+                for service in services:
+                    if service.__name__ not in keys:
+                        retval = self._timedOut(service, links.get(service.__name__, []), deadline)
+                        yield retval
+                        keys[retval.classname] = retval
         yield None
+        keys = keys.values()
         any_comments_archived = any(map(lambda e : e.comments, keys))
         any_metaonly_archived = any(map(lambda e : e.metaonly and e.archived, keys))
         any_videos_archived = any(map(lambda e : e.archived and not e.metaonly, keys))
         any_archived = {"video": any_videos_archived, "metaonly": any_metaonly_archived, "comments": any_comments_archived, "human_friendly": None}
         verdict = create_verdict(any_archived)
         any_archived['human_friendly'] = verdict
+        if deadline is not None or firstHit:
+            any_archived['partial'] = expired or (stopped and len(keys) < len(services))
         yield any_archived
 
-    async def generateStream(self, id: str, includeRaw=False):
-        gen = self._generateStream(id, includeRaw=includeRaw)
+    def _cancelFlights(self, services: list[type['BaseService']], id: str, finished: dict):
+        """
+        Stops the runs of the services that haven't finished, unless another lookup is still waiting for them.
+        """
+        for service in services:
+            if service.__name__ in finished:
+                continue
+            if (flight := self.flights.get((service, id))) and flight.cancel_if_unused():
+                # Don't let another lookup join it while it is being cancelled
+                del self.flights[(service, id)]
+
+    async def _runService(self, service: type['BaseService'], id: str, includeRaw: bool,
+                          staleWhileRevalidate=False, followUp=True):
+        """
+        Runs a single Service, or replays its cached result.
+        If the same Service is already running for that video ID, this follows that run instead of
+        starting another one.
+        The service is always run with the raw data included, so that the result can be shared between
+        both kinds of request; it is stripped out here if it isn't wanted.
+        In stale-while-revalidate mode, an expired result is replayed first, and then the Service is
+        run again in the background. If followUp is True, the new result is sent once it is ready.
+        If the Service's circuit breaker is open, an error result is sent instead of running it (or nothing
+        is sent after a stale result).
+        """
+        entry = (await self.cache.get(service, id, allowStale=staleWhileRevalidate)) if self.cache else None
+        if entry is not None:
+            for link in entry.links:
+                yield link
+            yield entry.service.copy(entry.links, includeRaw)
+            if entry.is_fresh():
+                return
+            flight = self._getFlight(service, id)
+            if flight is None:
+                return
+            self.revalidations += 1
+            if not followUp:
+                return
+        else:
+            flight = self._getFlight(service, id)
+            if flight is None:
+                yield self._fastFail(service)
+                return
+        async for item in flight.subscribe():
+            if isinstance(item, Link):
+                yield item
+            else:
+                yield item.copy(item.available, includeRaw)
+
+    def _getFlight(self, service: type['BaseService'], id: str) -> typing.Optional[Flight]:
+        """
+        Returns the in-flight run of that Service for that video ID, starting one if there isn't one.
+        Returns None if it would have to be started, but the Service's circuit breaker is open.
+        """
+        key = (service, id)
+        if flight := self.flights.get(key):
+            self.coalesced += 1
+            return flight
+        if not self.get_breaker(service).allow():
+            return None
+        flight = self.flights[key] = Flight(self._fetch(service, id))
+        flight.task.add_done_callback(lambda _: self.flights.pop(key) if self.flights.get(key) is flight else None)
+        return flight
+
+    async def _fetch(self, service: type['BaseService'], id: str):
+        """
+        Runs a Service, storing its result in the cache.
+        """
+        # This runs in the flight's own task, so it doesn't affect anything else
+        current_service.set(service)
+        links = []
+        success = False
+        try:
+            async for item in service.run(id, self, includeRaw=True):
+                if isinstance(item, Link):
+                    links.append(item)
+                else:
+                    success = item.error is None
+                    self.get_latency(service).record_run(item.archived and not item.metaonly and success)
+                    if self.cache:
+                        await self.cache.put(service, id, item, links)
+                yield item
+        except (asyncio.CancelledError, GeneratorExit):
+            # Nobody was waiting for it any more; that says nothing about the service
+            success = None
+            raise
+        finally:
+            self.get_breaker(service).record(success)
+
+    def _timedOut(self, service: type['BaseService'], links: list['Link'], deadline: float) -> 'BaseService':
+        """
+        Returns the result used for a Service that didn't finish before the deadline, with the links it had sent.
+        """
+        return service(
+            archived=False, error="Deadline exceeded", lastupdated=time.time(), name=service.getName(),
+            note=f"{service.getName()} didn't finish within {deadline:g} seconds.",
+            rawraw=None, metaonly=False, available=links, classname=service.__name__
+        )
+
+    def _crashed(self, service: type['BaseService'], links: list['Link'], error: Exception) -> 'BaseService':
+        """
+        Returns the result used for a Service whose run failed outside the Service's own error handling.
+        """
+        return service(
+            archived=False, error=f"{type(error)}: {repr(error)}", lastupdated=time.time(), name=service.getName(),
+            note=f"An error occured while retrieving data from {service.getName()}.",
+            rawraw=None, metaonly=False, available=links, classname=service.__name__
+        )
+
+    def _fastFail(self, service: type['BaseService']) -> 'BaseService':
+        """
+        Returns the result used while a Service's circuit breaker is open. It isn't cached.
+        """
+        retry = math.ceil(self.get_breaker(service).retry_in())
+        return service(
+            archived=False, error="Circuit breaker open", lastupdated=time.time(), name=service.getName(),
+            note=f"{service.getName()} has failed too many times in a row, so it is being skipped. It will be tried again in {retry} seconds.",
+            rawraw=None, metaonly=False, classname=service.__name__
+        )
+
+    async def generateStream(self, id: str, includeRaw=False, staleWhileRevalidate=False,
+                             deadline: typing.Optional[float] = None, firstHit=False, include=None, exclude=None):
+        """
+        Arguments:
+            id (str): The video ID
+            includeRaw (bool): Whether or not to include the raw data in the `rawraw` field.
+            staleWhileRevalidate (bool): If True, expired cached results are sent straight away, with their original
+                `lastupdated`. The services are run again, and their new results are sent as follow-up items
+                before the None.
+            deadline (Optional[float]): How long to wait for the services, in seconds. Services that haven't
+                finished by then are sent as errors, and the verdict's `partial` key says whether that happened.
+            firstHit (bool): Stop as soon as a service finds the video, cancelling the others.
+            include, exclude (Optional[Iterable]): Which services to run; see `select_services`.
+        """
+        # Check the selection now, rather than when the stream is first read
+        services = self.select_services(include, exclude)
+        gen = self._generateStream(
+            id, includeRaw=includeRaw, staleWhileRevalidate=staleWhileRevalidate, deadline=deadline, firstHit=firstHit,
+            include=services
+        )
         return StreamResponse(gen)
 
-    async def generate(self, id: str, includeRaw=False):
-        generator = await self.generateStream(id, includeRaw)
+    async def generate(self, id: str, includeRaw=False, staleWhileRevalidate=False,
+                       deadline: typing.Optional[float] = None, firstHit=False, include=None, exclude=None):
+        """
+        Arguments:
+            id (str): The video ID
+            includeRaw (bool): Whether or not to include the raw data in the `rawraw` field.
+            staleWhileRevalidate (bool): If True, expired cached results are returned straight away, with their
+                original `lastupdated`. The services are run again in the background to update the cache.
+            deadline (Optional[float]): How long to wait for the services, in seconds. Services that haven't
+                finished by then are returned as errors, and the verdict's `partial` key says whether that happened.
+            firstHit (bool): Stop as soon as a service finds the video, cancelling the others. If that happens, only
+                the service that found it is returned.
+            include, exclude (Optional[Iterable]): Which services to run; see `select_services`.
+        """
+        generator = StreamResponse(self._generateStream(
+            id, includeRaw=includeRaw, staleWhileRevalidate=staleWhileRevalidate, followUp=False,
+            deadline=deadline, firstHit=firstHit, include=include, exclude=exclude
+        ))
         # ignore the list of names as that is redundant in this case
         await anext(generator)
         results = []
@@ -157,8 +588,51 @@ class FytSession:
                 break
             results.append(result)
         any_archived = await anext(generator)
+        if firstHit and any_archived["partial"]:
+            hits = [result for result in results if result.archived and not result.metaonly and result.error is None]
+            if hits:
+                results = hits[:1]
         return Response(id=id, status="ok", keys=results, verdict=any_archived)
 
+    async def generateBatch(self, ids: typing.Iterable[str], includeRaw=False, concurrency=8, **kwargs):
+        """
+        Looks up many videos, at most `concurrency` at a time. Across all the batches running in this session,
+        at most `batch.concurrency` (from config.yml) lookups run at once; the batches take turns.
+        Yields (id, result) tuples in the order the lookups finish. The result is the Response, None if the ID
+        is invalid, or the exception if the lookup failed unexpectedly.
+        Other keyword arguments are passed to `generate`.
+        """
+        ids = iter(ids)
+        results = asyncio.Queue()
+
+        async def worker():
+            for id in ids:
+                if not self.verifyId(id):
+                    await results.put((id, None))
+                    continue
+                try:
+                    async with self.batchSlots:
+                        response = await self.generate(id, includeRaw, **kwargs)
+                    await results.put((id, response))
+                except Exception as ename: # pylint: disable=broad-except
+                    traceback.print_exc()
+                    await results.put((id, ename))
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+        remaining = len(workers)
+        for task in workers:
+            task.add_done_callback(lambda _: results.put_nowait(None))
+        try:
+            while remaining:
+                result = await results.get()
+                if result is None:
+                    remaining -= 1
+                    continue
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+
     @staticmethod
     def verifyId(id: str) -> bool:
         """
@@ -198,6 +672,19 @@ class BaseService(JSONDataclass):
     maybe_paywalled: bool = False
 
     configId = None
+    # Services that can look up many videos in one request set this to a coroutine classmethod that takes a list
+    # of video IDs and the FytSession, and returns a dict of video ID to whatever `_run` needs. They call
+    # `session.get_batcher(cls).submit(id)` from `_run`.
+    _fetchBatch: typing.ClassVar[typing.Optional[typing.Callable[[list[str], FytSession], typing.Awaitable[dict]]]] = None
+    # Defaults for services that implement _fetchBatch
+    batch_window = 0.05
+    batch_max_size = 50
+    # Optional coroutine function awaited before each batch is fetched (see Batcher). It is passed the FytSession.
+    _batchGate: typing.ClassVar[typing.Optional[typing.Callable[[FytSession], typing.Awaitable]]] = None
+    # The hosts the service sends requests to, and the default rate limit for them
+    # (e.g. {"rate": 0.5, "burst": 1}, i.e. one request every two seconds). Can be changed in config.yml.
+    hosts: typing.ClassVar[tuple[str, ...]] = ()
+    ratelimit: typing.ClassVar[typing.Optional[dict]] = None
     type: str = "service"
     comments: bool = False
 
@@ -212,9 +699,7 @@ class BaseService(JSONDataclass):
 
     @classmethod
     def enabled(cls):
-        configId = cls.configId
-        serviceConfig = methods[configId]
-        return serviceConfig['enabled']
+        return config.method(cls.configId)['enabled']
 
     @classmethod
     async def run(cls, id: str, session: FytSession, includeRaw=True, **kwargs):
@@ -253,8 +738,10 @@ class BaseService(JSONDataclass):
     @classmethod
     def getName(cls) -> str:
         """
-        Gets the name of the service.
+        Gets the name of the service (its title in config.yml).
         """
+        if title := config.methods.get(cls.configId, {}).get("title"):
+            return title
         return getattr(cls, "name", cls.__name__)
 
     def __str__(self):
@@ -269,8 +756,72 @@ class BaseService(JSONDataclass):
             string += f"\t{self.error}\n"
         return string + "\n"
 
+    def copy(self, available: list["Link"], includeRaw: bool = True):
+        """
+        Returns a shallow copy of the Service with the given links, optionally without the raw data.
+        Copies share their serialized JSON (see `serialization.py`) with every other copy that has the same data.
+        """
+        service = copy.copy(self)
+        service.available = list(available)
+        if includeRaw:
+            service._json = self.__dict__.setdefault("_json", {})
+        else:
+            service.rawraw = None
+            service._json = self.__dict__.setdefault("_jsonWithoutRaw", {})
+        return service
+
+    def to_cache(self) -> dict:
+        """
+        Converts the Service and its links into a JSON-compatible dict, for persistent caches.
+        """
+        data = {field.name: getattr(self, field.name) for field in dataclasses.fields(self) if field.name != "available"}
+        data["available"] = [link.to_cache() for link in self.available]
+        return data
+
+    @classmethod
+    def from_cache(cls, data: dict):
+        """
+        The inverse of `to_cache`. Returns the Service and its list of links.
+        """
+        data = dict(data)
+        links = [Link.from_cache(link) for link in data.pop("available")]
+        service = cls(**data)
+        service.available = links
+        return service, links
+
+    def _shallow(self):
+        """
+        Returns a shallow copy without the serialized JSON, for conversion to another API version.
+        Conversions must only ever replace attributes of the copy, never mutate them, as the values are shared.
+        """
+        service = copy.copy(self)
+        service.__dict__.pop("_json", None)
+        service.__dict__.pop("_jsonWithoutRaw", None)
+        return service
+
+    def _downgrade(self, currentVersion: int, targetVersion: int):
+        """
+        Converts the Service straight from one API version to an older one.
+        """
+        service = self
+        if currentVersion >= 5 > targetVersion:
+            service = service._5to4()
+        # There were no changes to services between v3 and v4
+        if currentVersion >= 3 > targetVersion:
+            service = service._3to2()
+        return service
+
+    def _3to2(self):
+        service = self._shallow()
+        if service.error is None:
+            service.error = False
+        else:
+            service.rawraw = service.error
+            service.error = True
+        return service
+
     def _5to4(self):
-        service = copy.deepcopy(self)
+        service = self._shallow()
         service.capcount = 1 if service.archived else 0
         if service.available:
             contains = service.available[0].contains
@@ -287,6 +838,18 @@ class Service(BaseService):
 class InvalidVideoIdError(ValueError):
     pass
 
+class UnknownServiceError(ValueError):
+    """
+    Raised when a service or category given to `select_services` doesn't exist.
+    """
+    pass
+
+class NoServicesSelectedError(ValueError):
+    """
+    Raised when the include and exclude lists given to `select_services` leave nothing to run.
+    """
+    pass
+
 class TargetAPIVersionTooLowError(ValueError):
     """
     Raised when `coerce_to_api_version` is called with an unsupported API version.
@@ -367,24 +930,100 @@ class StreamResponse:
         yield verdictObjectFunction(await anext(self.gen))
 
 
-@dataclasses.dataclass
 class LinkContains(JSONDataclass):
-    video: bool = False
-    metadata: bool = False
-    comments: bool = False
-    thumbnail: bool = False
-    captions: bool = False
+    """
+    What a Link could contain. Stored as a bitflag; there is only ever one instance for each combination,
+    so they are immutable and cheap to share between Links.
+
+    Attributes:
+        video (bool)
+        metadata (bool)
+        comments (bool)
+        thumbnail (bool)
+        captions (bool)
+        standalone_video (bool): Just the video, no audio.
+        standalone_audio (bool): Just the audio, no video.
+        single_frame (bool): A single frame from the video.
+    """
+    __slots__ = ("flags", "_json")
+
+    FIELDS: typing.ClassVar[tuple[str, ...]] = (
+        "video", "metadata", "comments", "thumbnail", "captions",
+        "standalone_video", "standalone_audio", "single_frame",
+    )
+    _instances: typing.ClassVar[dict[int, "LinkContains"]] = {}
+
+    def __new__(cls, *args: bool, **kwargs: bool):
+        if len(args) > len(cls.FIELDS):
+            raise TypeError(f"LinkContains takes at most {len(cls.FIELDS)} arguments")
+        flags = 0
+        for bit, name in enumerate(cls.FIELDS):
+            if bit < len(args):
+                if name in kwargs:
+                    raise TypeError(f"LinkContains got multiple values for argument {name!r}")
+                value = args[bit]
+            else:
+                value = kwargs.pop(name, False)
+            if value:
+                flags |= 1 << bit
+        if kwargs:
+            raise TypeError(f"LinkContains got unexpected arguments {list(kwargs)}")
+        return cls.from_flags(flags)
+
+    @classmethod
+    def from_flags(cls, flags: int) -> "LinkContains":
+        """
+        Returns the shared instance for that combination of flags.
+        """
+        self = cls._instances.get(flags)
+        if self is None:
+            self = object.__new__(cls)
+            object.__setattr__(self, "flags", flags)
+            object.__setattr__(self, "_json", None)
+            cls._instances[flags] = self
+        return self
 
-    standalone_video: bool = False
-    """Just the video, no audio."""
-    standalone_audio: bool = False
-    """Just the audio, no video."""
+    def __setattr__(self, name, value):
+        raise AttributeError("LinkContains is immutable")
 
-    single_frame: bool = False
-    """A single frame from the video."""
+    def __reduce__(self):
+        return (type(self).from_flags, (self.flags,))
 
+    def __copy__(self):
+        return self
 
-@dataclasses.dataclass
+    def __deepcopy__(self, memo):
+        return self
+
+    def __eq__(self, other):
+        if not isinstance(other, LinkContains):
+            return NotImplemented
+        return self.flags == other.flags
+
+    def __hash__(self):
+        return hash(self.flags)
+
+    def __repr__(self):
+        return f"LinkContains({', '.join(f'{name}={getattr(self, name)}' for name in self.FIELDS)})"
+
+    def asdict(self) -> dict[str, bool]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __json_write__(self, buf: bytearray):
+        if self._json is None:
+            fields = ", ".join(f'"{name}": {"true" if getattr(self, name) else "false"}' for name in self.FIELDS)
+            object.__setattr__(self, "_json", f'{{"_type": "{type(self).__module__}.{type(self).__name__}", {fields}}}'.encode())
+        buf += self._json
+
+def _linkContainsFlag(bit: int):
+    return property(lambda self: bool(self.flags & (1 << bit)))
+
+for _bit, _name in enumerate(LinkContains.FIELDS):
+    setattr(LinkContains, _name, _linkContainsFlag(_bit))
+del _bit, _name
+
+
+@dataclasses.dataclass(slots=True)
 class Link(JSONDataclass):
     """
     A link. Returned in the available field on API v5 and up.
@@ -402,6 +1041,21 @@ class Link(JSONDataclass):
     note: typing.Optional[str] = None
     type: str = "link"
     classname: str = dataclasses.field(init = False)
+    # The encoded JSON, once it has been serialized (see serialization.py).
+    _json: typing.Optional[bytes] = dataclasses.field(default = None, init = False, repr = False, compare = False)
+
+    def to_cache(self) -> dict:
+        return {
+            "url": self.url, "contains": self.contains.asdict(),
+            "title": self.title, "note": self.note,
+        }
+
+    @classmethod
+    def from_cache(cls, data: dict):
+        return cls(
+            url=data["url"], contains=LinkContains(**data["contains"]),
+            title=data["title"], note=data["note"],
+        )
 
 
 @dataclasses.dataclass
@@ -422,55 +1076,27 @@ class Response(JSONDataclass):
     verdict: dict
     api_version: int = API_VERSION
 
-    def coerce_to_api_version(selfNEW, targetVersion): # pylint: disable=no-self-argument
+    # The oldest version that coerce_to_api_version can produce.
+    min_api_version: typing.ClassVar[int] = 2
+
+    def coerce_to_api_version(self, targetVersion):
         """
         If necessary, downgrades the API version to one of your choice, then returns it.
         It is recommended to base your code around a specific API version and coerce it to that version.
+        The result is a new Response; services are shallow copies that share unchanged values (such as `rawraw`)
+        with the original, so don't mutate them in place.
 
         Arguments:
             targetVersion (int): The target API version. Must be lower than self.api_version
 
         Raises either TargetAPIVersionTooHighError or TargetAPIVersionTooLowError if the target is unsupported.
         """
-        self = copy.deepcopy(selfNEW)
-        currentApiVersion = self.api_version
-        if currentApiVersion < targetVersion:
+        if self.api_version < targetVersion:
             raise TargetAPIVersionTooHighError("cannot upgrade api version")
-        while self.api_version != targetVersion:
-            fname = f"_convert_v{self.api_version}_to_v{self.api_version-1}"
-            if not hasattr(self, fname):
-                raise TargetAPIVersionTooLowError("cannot downgrade any further")
-            self = getattr(self, fname)()
-        assert self.api_version == targetVersion
-        return self
-
-    def _convert_v5_to_v4(selfNEW): # pylint: disable=no-self-argument
-        self = copy.deepcopy(selfNEW)
-        assert self.api_version == 5
-        self.api_version = 4
-        for i, service in enumerate(self.keys):
-            self.keys[i] = service._5to4()
-        return self
-
-    # There were no changes to the data structure between v3 and v4
-    def _convert_v4_to_v3(selfNEW): # pylint: disable=no-self-argument
-        self = copy.deepcopy(selfNEW)
-        assert self.api_version == 4
-        self.api_version = 3
-        return self
-
-    def _convert_v3_to_v2(selfNEW): # pylint: disable=no-self-argument
-        self = copy.deepcopy(selfNEW)
-        assert self.api_version == 3
-        self.api_version = 2
-        for index, service in enumerate(self.keys):
-            if service.error is None:
-                service.error = False
-            else:
-                service.rawraw = service.error
-                service.error = True
-            self.keys[index] = service
-        return self
+        if targetVersion < self.min_api_version:
+            raise TargetAPIVersionTooLowError("cannot downgrade any further")
+        keys = [service._downgrade(self.api_version, targetVersion) for service in self.keys]
+        return dataclasses.replace(self, keys=keys, api_version=targetVersion)
 
     def __str__(self):
         services = "Services:\n"
@@ -502,6 +1128,32 @@ class ServiceRegistry:
     def get_services(self):
         return [j for i in self.services.values() for j in i]
 
+    def match(self, selectors: typing.Iterable) -> set[type[Service]]:
+        """
+        Returns the services that match any of the selectors (see `FytSession.select_services`).
+        """
+        matched = set()
+        for selector in selectors:
+            if isinstance(selector, ServiceCategory):
+                matched.update(self.services[selector])
+                continue
+            if isinstance(selector, type):
+                matched.add(selector)
+                continue
+            name = str(selector).strip().casefold()
+            found = False
+            for category, services in self.services.items():
+                if category.name.casefold() == name:
+                    matched.update(services)
+                    found = True
+                for service in services:
+                    if name in (service.__name__.casefold(), str(service.configId).casefold()):
+                        matched.add(service)
+                        found = True
+            if not found:
+                raise UnknownServiceError(selector)
+        return matched
+
     def youtube(self, service: Service):
         self.add_service(ServiceCategory.YOUTUBE, service)
 